@@ -0,0 +1,68 @@
+"""
+Scaling of RedcapProcessor._Process_Death_Withdrawals on synthetic patients (8 rows each).
+
+    python benchmarks/bench_death_withdrawals.py
+
+Prints the time per size and the time per patient relative to the smallest size (about 1
+for linear scaling), and appends the table to bench_output.txt at the repository root.
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from redcap_classes_V2 import RedcapProcessor  # noqa: E402
+
+SIZES = [1_000, 2_500, 5_000, 10_000, 20_000]
+ROWS_PER_PATIENT = 8
+REPEATS = 3
+
+
+def make_frame(n_patients, seed=0):
+    rng = np.random.default_rng(seed)
+    study_ids = np.repeat([f'P-{i:05d}' for i in range(n_patients)], ROWS_PER_PATIENT)
+    withdrawn = rng.choice(['', 'Death', '2024-01-01', np.nan, np.nan, np.nan], size=len(study_ids))
+    comp_death = rng.choice(['No', 'Yes', 'Checked', np.nan] + ['No'] * 20, size=len(study_ids))
+    return pd.DataFrame({'StudyID': study_ids, 'Withdrawn': withdrawn, 'comp_death': comp_death})
+
+
+def time_step(processor, frame):
+    """Best of REPEATS runs of the step on a fresh copy of frame."""
+    best = np.inf
+    for _ in range(REPEATS):
+        processor.df = frame.copy()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor._Process_Death_Withdrawals()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    # No API calls are made; the project object is never used by this step
+    processor = RedcapProcessor('offline', 'offline', project=object())
+
+    lines = [f'_Process_Death_Withdrawals ({ROWS_PER_PATIENT} rows per patient, best of {REPEATS})',
+             f'{"patients":>9} {"seconds":>9} {"per patient (rel.)":>19}']
+    base = None
+    for n in SIZES:
+        seconds = time_step(processor, make_frame(n))
+        per_patient = seconds / n
+        base = base or per_patient
+        lines.append(f'{n:>9,} {seconds:>9.3f} {per_patient / base:>19.2f}')
+
+    report = '\n'.join(lines)
+    print(report)
+    with open(os.path.join(ROOT, 'bench_output.txt'), 'a') as f:
+        f.write(report + '\n\n')
+
+
+if __name__ == '__main__':
+    main()
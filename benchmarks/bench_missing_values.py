@@ -0,0 +1,73 @@
+"""
+Missing-value clearing: the three DataFrame.replace calls of steps 02/05/10 vs
+mask_object_values (each distinct value tested once) at the same three steps.
+
+    python benchmarks/bench_missing_values.py
+
+Checks that both give the same frame and appends the timings to bench_output.txt.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from redcap_classes_V2 import mask_object_values  # noqa: E402
+
+SIZES = [(12_000, 54), (50_000, 54)]
+REPEATS = 3
+MISSING_CODES = ['None', '-999', '', 'NaN', 'Not applicable', '-2997', None]
+
+# Label export cells: real values, blanks, and the REDCap missing codes
+CELL_VALUES = np.array(['Yes', 'No', 'Checked', 'Unchecked', '12.5', '2024-01-01 10:00', 'POD1', '',
+                        ' ', '-999', 'Not applicable', '-2997', 'Participant Withdrawn', 'NaN', 'None'], dtype=object)
+
+
+def make_export(n_rows, n_cols, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({f'field_{i}': rng.choice(CELL_VALUES, size=n_rows) for i in range(n_cols)})
+
+
+def with_replace(df):
+    df = df.replace(r'^\s*$', np.nan, regex=True)
+    df = df.replace({'Participant Withdrawn': np.nan})
+    return df.replace(MISSING_CODES, np.nan)
+
+
+def with_mask(df):
+    codes = set(MISSING_CODES[:-1])
+    df = mask_object_values(df, lambda v: isinstance(v, str) and not v.strip())
+    df = mask_object_values(df, lambda v: v == 'Participant Withdrawn')
+    return mask_object_values(df, lambda v: v in codes, none_to_nan=True)
+
+
+def best_time(func, df):
+    best, out = np.inf, None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        out = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    lines = [f'Missing-value clearing, steps 02/05/10 (best of {REPEATS})',
+             f'{"rows x cols":>12} {"replace":>9} {"mask":>9} {"same":>5}']
+    for n_rows, n_cols in SIZES:
+        df = make_export(n_rows, n_cols)
+        old_s, old = best_time(with_replace, df)
+        new_s, new = best_time(with_mask, df)
+        lines.append(f'{f"{n_rows}x{n_cols}":>12} {old_s:>8.2f}s {new_s:>8.2f}s {str(old.equals(new)):>5}')
+
+    report = '\n'.join(lines)
+    print(report)
+    with open(os.path.join(ROOT, 'bench_output.txt'), 'a') as f:
+        f.write(report + '\n\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""Column helpers shared by the pipeline and the analysis modules (pandas only, no REDCap/plotting/stats dependencies)."""
+import pandas as pd
+
+
+def as_numeric(series):
+    """Series as numbers; columns already typed by RedcapProcessor are returned as they are."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series, errors='coerce')
+
+
+def as_category(series, categories=(), ordered=False):
+    """
+    Series as a categorical: the given categories first (in that order), then any other
+    observed values, sorted.
+    """
+    extra = sorted(set(series.dropna().unique()) - set(categories), key=str)
+    return series.astype(pd.CategoricalDtype(list(categories) + extra, ordered=ordered))
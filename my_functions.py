@@ -12,6 +12,8 @@ import scikit_posthocs as sp
 import os
 from scipy import stats
 from IPython.display import display
+from column_helpers import as_category, as_numeric
+from time_axis import TIME_AXIS, TIME_LABELS
 
 #############################
 def my_tableone(df, cols, cats, non_norm, group):
@@ -19,7 +21,7 @@ def my_tableone(df, cols, cats, non_norm, group):
 
     # Ensure non-normal variables are numeric
     for variable in non_norm:
-        df[variable] = pd.to_numeric(df[variable], errors='coerce')
+        df[variable] = as_numeric(df[variable])
 
     # Automatically detect the two unique levels of the grouping variable
     group_levels = df[group].dropna().unique()
@@ -204,8 +206,8 @@ def analyze_hgb(df_blood_draws, pod_time="POD1", title=None):
     # Merge & clean
     df_hgb = pd.merge(first_draw, pod_draw, on='StudyID', how='outer')
     df_hgb = df_hgb.sort_values('StudyID').dropna().reset_index(drop=True)
-    df_hgb['Hgb_first_draw'] = pd.to_numeric(df_hgb['Hgb_first_draw'], errors='coerce')
-    df_hgb[f'Hgb_{pod_time}'] = pd.to_numeric(df_hgb[f'Hgb_{pod_time}'], errors='coerce')
+    df_hgb['Hgb_first_draw'] = as_numeric(df_hgb['Hgb_first_draw'])
+    df_hgb[f'Hgb_{pod_time}'] = as_numeric(df_hgb[f'Hgb_{pod_time}'])
     df_hgb['delta_Hgb'] = df_hgb[f'Hgb_{pod_time}'] - df_hgb['Hgb_first_draw']
 
     # Wilcoxon test & bootstrap
@@ -266,7 +268,7 @@ def plot_variables_over_time(
     df : pd.DataFrame
         Must contain 'Time' column and variables to plot.
     custom_order : list, optional
-        Ordering of time categories.
+        Timepoints to plot, in order (names from TIME_AXIS). Defaults to the usual TEG draws.
     variables : list, optional
         Variables to plot. Defaults to common TEG vars.
     hue : str, optional
@@ -303,7 +305,7 @@ def plot_variables_over_time(
         
     df = df.copy()
     df = df[~df['Time'].isna()]
-    df['Time'] = pd.Categorical(df['Time'], categories=custom_order, ordered=True)
+    df['Time'] = as_category(df['Time'], TIME_AXIS.categories, ordered=True).cat.set_categories(custom_order, ordered=True)
 
     if palette is None and hue is not None:
         palette = sns.color_palette("Set2", n_colors=df[hue].nunique())
@@ -320,21 +322,6 @@ def plot_variables_over_time(
         for var in variables:
             fig, ax = plt.subplots(figsize=(10, 4))
 
-            time_labels = {
-                'Pre_Op': 'PreOp',
-                'Post_Op': 'PO1H',
-                'POD1': 'POD1',
-                'POD3': 'POD3',
-                'POD5': 'PD5',
-                'POD7': 'PD7',
-                'Week2': 'Week2',
-                'Week4': 'Week4',
-                'Week6': 'Week6',
-                'Month3': 'Month3'
-            }
-
-
-
             line_kwargs = dict(
                 x='Time',
                 y=var,
@@ -355,7 +342,7 @@ def plot_variables_over_time(
                 line_kwargs["dashes"] = dashes
 
             sns.lineplot(**line_kwargs)
-            ax.set_xticklabels([time_labels.get(t.get_text(), t.get_text()) 
+            ax.set_xticklabels([TIME_LABELS.get(t.get_text(), t.get_text()) 
                         for t in ax.get_xticklabels()])
             
 
@@ -394,21 +381,6 @@ def plot_variables_over_time(
         for var in variables:
             fig, ax = plt.subplots(figsize=(10, 4))
 
-            time_labels = {
-                'Pre_Op': 'PreOp',
-                'Post_Op': 'PO1H',
-                'POD1': 'POD1',
-                'POD3': 'POD3',
-                'POD5': 'PD5',
-                'POD7': 'PD7',
-                'Week2': 'Week2',
-                'Week4': 'Week4',
-                'Week6': 'Week6',
-                'Month3': 'Month3'
-            }
-
-
-
             line_kwargs = dict(
                 x='Time',
                 y=var,
@@ -429,7 +401,7 @@ def plot_variables_over_time(
                 line_kwargs["dashes"] = dashes
 
             sns.lineplot(**line_kwargs)
-            ax.set_xticklabels([time_labels.get(t.get_text(), t.get_text()) 
+            ax.set_xticklabels([TIME_LABELS.get(t.get_text(), t.get_text()) 
                         for t in ax.get_xticklabels()])
             
             # Add horizontal reference lines for specific variables
@@ -625,7 +597,7 @@ def hemoglobin_prior_to_first_rbc(
     # First RBC transfusion time per StudyID
     first_rbc = (
         rbc_patients
-        .groupby(study_id_col, as_index=False)
+        .groupby(study_id_col, as_index=False, observed=True)
         .min()
         .rename(columns={rbc_time_col: "first_rbc_time"})
     )
@@ -643,7 +615,7 @@ def hemoglobin_prior_to_first_rbc(
     hb_prior = (
         labs_pre_rbc
         .sort_values([study_id_col, lab_time_col])
-        .groupby(study_id_col, as_index=False)
+        .groupby(study_id_col, as_index=False, observed=True)
         .last()
     )
 
@@ -764,7 +736,7 @@ def compare_to_reference(
 
     results = []
 
-    for timepoint, group in df.groupby(time_col):
+    for timepoint, group in df.groupby(time_col, observed=True):
         values = group[value_col].dropna()
         n = len(values)
 
@@ -810,14 +782,16 @@ def compare_to_reference(
 
     results_df = pd.DataFrame(results)
 
-    # ---- Optional ordering ----
-    if time_order is not None:
+    # ---- Ordering: TIME_AXIS unless time_order is given ----
+    if time_order is None:
+        results_df["Timepoint"] = as_category(results_df["Timepoint"], TIME_AXIS.categories, ordered=True)
+    else:
         results_df["Timepoint"] = pd.Categorical(
             results_df["Timepoint"],
             categories=time_order,
             ordered=True
         )
-        results_df = results_df.sort_values("Timepoint")
+    results_df = results_df.sort_values("Timepoint")
 
     if not return_styled:
         return results_df
@@ -876,7 +850,7 @@ def proportion_summary(
     -------
     Styled pandas dataframe
     """
-    counts = (df.groupby(time_col)[state_col].value_counts().unstack(fill_value=0))
+    counts = (df.groupby(time_col, observed=True)[state_col].value_counts().unstack(fill_value=0))
     percent_df = counts.div(counts.sum(axis=1), axis=0) * 100
 
     percent_table = counts.astype(str) + " (" + percent_df.round(1).astype(str) + "%)"
@@ -1014,8 +988,10 @@ def table1_for_Daniyya(df, time_order, groupby, demographic_yn='No'):
     # TEG ANALYSIS PIPELINE
     # ===============================
 
+    # Time on TIME_AXIS; rows of each timepoint are looked up by category code
+    df = df.assign(Time=as_category(df["Time"], TIME_AXIS.categories, ordered=True))
     if time_order is None:
-        time_iter = sorted(df["Time"].dropna().unique())
+        time_iter = list(df["Time"].cat.remove_unused_categories().cat.categories)
     else:
         time_iter = time_order
 
@@ -1107,8 +1083,9 @@ def table1_for_Daniyya(df, time_order, groupby, demographic_yn='No'):
 
             print(f"{RED}{analysis['title']} | {label} - grouped by {groupby}{RESET}")
 
+            time_rows = df_.groupby("Time", observed=True).indices
             for Time in time_iter:
-                df_time = df_[df_["Time"] == Time]
+                df_time = df_.iloc[time_rows.get(Time, [])]
 
                 print(f"{BLUE}{Time}{RESET}")
                 print(f"{BLUE}{'*'*67}{RESET}")
@@ -16,6 +16,8 @@ from matplotlib.lines import Line2D
 from lifelines import KaplanMeierFitter
 from lifelines.statistics import logrank_test
 
+from column_helpers import as_numeric
+
 #############################
 
 
@@ -91,7 +93,7 @@ def table1(
 
         # ==================== CONTINUOUS ====================
         else:
-            df[var] = pd.to_numeric(df[var], errors='coerce')
+            df[var] = as_numeric(df[var])
 
             groups = [df[df[groupby] == g][var].dropna() for g in group_levels]
 
@@ -3,21 +3,432 @@ from IPython import display
 import pandas as pd
 import numpy as np
 import re
-from redcap import Project
+import os
+import json
+import hashlib
+import time
+import inspect
+import pickle
+import sys
+import tracemalloc
+import threading
+from datetime import datetime, timedelta
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import requests
+from redcap import Project, RedcapError
+
+# Pandas-only helpers shared with the analysis modules (TIME_AXIS/TIME_LABELS re-exported here)
+import column_helpers
+import time_axis
+from column_helpers import as_category
+from time_axis import TIME_AXIS, TIME_LABELS
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
 
 
+# -----------------------
+# Column helpers
+# -----------------------
+
+# Values REDCap uses for a ticked checkbox option (label or raw export)
+CHECKED_VALUES = ('checked', '1', 'true')
+
+
+def decode_checkbox_group(df, prefix, labels, sep='/'):
+    """
+    Join the labels of the ticked options of a REDCap checkbox field.
+
+    prefix: field name; its options are the columns '<prefix>___<code>'
+    labels: dict of option code -> label (options without a label are ignored)
+    Returns a Series of joined labels in column order, NaN where nothing is ticked.
+    """
+    labels = {str(code): label for code, label in labels.items()}
+    cols = [c for c in df.columns
+            if isinstance(c, str) and c.startswith(prefix + '___') and c[len(prefix) + 3:] in labels]
+    if not cols:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+
+    col_labels = [labels[c[len(prefix) + 3:]] for c in cols]
+
+    # Boolean matrix rows x options, in one pass over the block
+    values = df[cols].to_numpy(dtype=str)
+    checked = np.isin(np.char.lower(np.char.strip(values)), CHECKED_VALUES)
+
+    # Build the joined label once per distinct combination of ticked options
+    combos, inverse = np.unique(checked, axis=0, return_inverse=True)
+    joined = np.array(
+        [sep.join(label for label, on in zip(col_labels, combo) if on) or np.nan for combo in combos],
+        dtype=object
+    )
+
+    return pd.Series(joined[inverse.reshape(-1)], index=df.index)
+
+
+def join_non_null(df, cols, sep='/'):
+    """
+    Join the non-null values of cols per row, in column order; NaN where none is set (or the
+    result is empty). Same as apply(lambda x: sep.join(x.dropna().astype(str)), axis=1), but
+    joined once per distinct combination of values.
+    """
+    if len(df) == 0:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+
+    codes, uniques = zip(*(pd.factorize(df[c]) for c in cols))
+    combos, inverse = np.unique(np.column_stack(codes), axis=0, return_inverse=True)
+    joined = np.array(
+        [sep.join(str(values[k]) for values, k in zip(uniques, combo) if k >= 0) or np.nan for combo in combos],
+        dtype=object
+    )
+    return pd.Series(joined[inverse.reshape(-1)], index=df.index)
+
+
+def first_non_null(df, keys):
+    """
+    First non-null value of every column per key, keys sorted: groupby(keys).first(), but
+    column by column on positions, so object and categorical columns stay vectorized.
+    Returns (values frame with a RangeIndex, sorted keys).
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        valid = np.flatnonzero(values.notna().to_numpy() & (codes >= 0))
+        groups, first = np.unique(codes[valid], return_index=True)
+
+        # Row of each key's first value; -1 (missing) for keys with none
+        rows = np.full(len(uniques), -1)
+        rows[groups] = valid[first]
+        columns[col] = pd.api.extensions.take(values.array, rows, allow_fill=True)
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(uniques))), list(uniques)
+
+
+# Timestamp layouts of REDCap exports, tried in order before the generic parser
+REDCAP_DATETIME_FORMATS = ['%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+# Parsed string -> datetime64, shared by all processors (and threads) of the session; cleared
+# when full. Only read/updated under the lock; callers work on their own copy of the entries.
+_parsed_datetimes = {}
+_parsed_datetimes_lock = threading.Lock()
+_PARSED_DATETIMES_MAX = 500_000
+
+
+def _parse_datetime_strings(strings):
+    """{string: datetime64} of strings: known formats first, the generic parser for the rest."""
+    text = pd.Series(strings, dtype=object)
+    parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+    todo = np.ones(len(text), dtype=bool)
+    for fmt in REDCAP_DATETIME_FORMATS:
+        if not todo.any():
+            break
+        hit = pd.to_datetime(text[todo], format=fmt, errors='coerce')
+        parsed[hit.index] = hit
+        todo &= parsed.isna().to_numpy()
+    if todo.any():
+        parsed[todo] = pd.to_datetime(text[todo], errors='coerce')
+
+    return dict(zip(strings, parsed.to_numpy()))
+
+
+def parse_redcap_datetimes(values):
+    """
+    pd.to_datetime(values, errors='coerce'), parsing each distinct string once per session.
+    Scalars give a Timestamp/NaT; anything else a datetime64 Series (datetime input as is).
+    """
+    if np.ndim(values) == 0:
+        return pd.Timestamp(parse_redcap_datetimes(pd.Series([values], dtype=object)).iloc[0])
+
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    codes, uniques = pd.factorize(series)
+    uniques = list(uniques)
+
+    # Resolve every string of this call into a local dict first, so evicting the shared
+    # cache (by this or another thread) cannot drop entries this call still needs
+    strings = [v for v in uniques if isinstance(v, str)]
+    with _parsed_datetimes_lock:
+        resolved = {v: _parsed_datetimes[v] for v in strings if v in _parsed_datetimes}
+    new = [v for v in strings if v not in resolved]
+    if new:
+        fresh = _parse_datetime_strings(new)
+        resolved.update(fresh)
+        with _parsed_datetimes_lock:
+            if len(_parsed_datetimes) + len(fresh) > _PARSED_DATETIMES_MAX:
+                _parsed_datetimes.clear()
+            _parsed_datetimes.update(fresh)
+
+    # Non-string values (dates, Timestamps, numbers) keep pandas' own conversion
+    others = [i for i, v in enumerate(uniques) if not isinstance(v, str)]
+    converted = pd.to_datetime(pd.Series([uniques[i] for i in others], dtype=object), errors='coerce').to_numpy()
+
+    parsed = np.empty(len(uniques) + 1, dtype='datetime64[ns]')
+    parsed[-1] = np.datetime64('NaT')
+    for i, v in enumerate(uniques):
+        if isinstance(v, str):
+            parsed[i] = resolved[v]
+    parsed[others] = converted
+    return pd.Series(parsed[codes], index=series.index, name=series.name)
+
+
+def parse_time_of_day(times):
+    """
+    Clock-time strings ('HH:MM', 'HH:MM:SS', ...) as a timedelta Series since midnight, NaT
+    where unparsable. Each distinct string is parsed once: with the explicit '%H:%M:%S' format
+    (minutes-only times padded), and with the generic date parser for whatever that rejects.
+    """
+    codes, uniques = pd.factorize(times)
+    text = pd.Series(uniques, dtype=object).astype(str)
+    midnight = pd.Timestamp('2000-01-01')
+
+    padded = text.where(text.str.count(':') != 1, text + ':00')
+    parsed = pd.to_datetime('2000-01-01 ' + padded, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    retry = parsed.isna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime('2000-01-01 ' + text[retry], errors='coerce')
+
+    offsets = np.append((parsed - midnight).to_numpy(), np.timedelta64('NaT', 'ns'))
+    return pd.Series(offsets[codes], index=times.index)
+
+
+def mask_object_values(df, is_missing, none_to_nan=False):
+    """
+    Copy of df with the cells of its object columns set to NaN where is_missing(value) holds.
+    is_missing is called once per distinct non-null value and broadcast back via the factorize
+    codes; none_to_nan also turns None cells into NaN, as DataFrame.replace([..., None], np.nan).
+    """
+    df = df.copy()
+
+    # Positions, so duplicated column names are covered
+    for pos in np.flatnonzero((df.dtypes == object).to_numpy()):
+        values = df.iloc[:, pos]
+        codes, uniques = pd.factorize(values)
+        mask = np.array([bool(is_missing(v)) for v in uniques] + [False])[codes]  # -1 = already missing
+        if none_to_nan:
+            mask |= (codes == -1) & (values.to_numpy() == None)  # noqa: E711 (elementwise test)
+        if mask.any():
+            df.isetitem(pos, values.mask(mask))
+    return df
+
+
+def map_distinct(series, func):
+    """series.map(func), calling func once per distinct non-null value (NaN stays NaN)."""
+    codes, uniques = pd.factorize(series)
+    mapped = np.array([func(v) for v in uniques] + [np.nan], dtype=object)
+    return pd.Series(mapped[codes], index=series.index, name=series.name)
+
+
+# Event names left in Time by get_all_labs (from the Draw_ID), relabelled to timepoints
+EVENT_TIME_LABELS = {
+    'Pre-Operative': 'Pre_Op',
+    'Pre-Operative (Arm 1: Arm 1)': 'Pre_Op',
+    'Post-Operative                ': 'Post_Op',
+    'Post-Operative': 'Post_Op',
+    'Post-Operative (Arm 1: Arm 1)': 'Post_Op',
+    '1-hour Post-Op (Arm 1: Arm 1)': 'Post_Op',
+    'POD 1 (Arm 1: Arm 1)': 'POD1',
+    'POD 2 (Arm 1: Arm 1)': 'POD2',
+    'POD 3 (Arm 1: Arm 1)': 'POD3',
+    'Patient Admission': 'Admission',
+    'Intra-Operative': 'Intra_Op',
+    'Intra-Opertative': 'Intra_Op',
+    'Intra-Operative (Arm 1: Arm 1)': 'Intra_Op',
+    'Unscheduled Follow Up ': 'Unscheduled',
+    'Unscheduled Follow-up': 'Unscheduled',
+    'Unscheduled (Arm 1: Arm 1)': 'Unscheduled',
+    '12 Week Follow Up (Arm 1: Arm 1)': 'Month3',
+}
+
+
+class AliasResolver:
+    """
+    replacement_dict/timepoint_dict compiled into flat lookups:
+    columns: column alias -> standard name; timepoints: lower-case alias -> timepoint.
+    Use AliasResolver.for_tables(); processors with the same tables share one instance.
+    """
+
+    _compiled = {}
+
+    def __init__(self, replacement_dict, timepoint_dict, event_labels=EVENT_TIME_LABELS):
+        # Later entries win for an alias listed twice, as with the original per-step loops
+        self.columns = {alias: name for aliases, name in replacement_dict.items() for alias in aliases}
+        self.timepoints = {alias.lower(): tp for tp, aliases in timepoint_dict.items() for alias in aliases}
+        self.event_labels = dict(event_labels)
+
+    @classmethod
+    def for_tables(cls, replacement_dict, timepoint_dict):
+        key = hashlib.sha1(repr((replacement_dict, timepoint_dict)).encode()).hexdigest()
+        if key not in cls._compiled:
+            cls._compiled[key] = cls(replacement_dict, timepoint_dict)
+        return cls._compiled[key]
+
+    def rename_columns(self, df):
+        return df.rename(columns={c: self.columns[c] for c in df.columns if c in self.columns})
+
+    def map_timepoints(self, series):
+        """Free-text timepoints -> standard timepoint (case-insensitive); unknown values -> NaN."""
+        return map_distinct(series, lambda v: self.timepoints.get(str(v).lower(), np.nan))
+
+    def relabel_events(self, series):
+        """Event names -> timepoint; other values are kept."""
+        return map_distinct(series, lambda v: self.event_labels.get(v, v))
+
+
+# Per-patient annotations (pre-op medication, UTI, VTE timepoint), one row per StudyID.
+# Edit the table (or pass another one as RedcapProcessor(annotations=...)) to update them.
+PATIENT_ANNOTATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patient_annotations_v1.csv')
+
+# Columns an annotation table must provide (joined onto self.df; other columns are ignored)
+PATIENT_ANNOTATION_COLUMNS = ['Pre_op_med', 'UTI', 'VTE_time']
+
+# (path, mtime) -> loaded annotation frame, shared by all processors of the session
+_loaded_annotations = {}
+
+
+def load_patient_annotations(source=PATIENT_ANNOTATIONS):
+    """
+    StudyID-indexed annotation frame (PATIENT_ANNOTATION_COLUMNS) from a CSV/Parquet file
+    (or a DataFrame with a StudyID column or index). Files are read once per modification
+    time; blank cells are NaN. Raises ValueError for missing columns or duplicate StudyIDs.
+    """
+    if isinstance(source, pd.DataFrame):
+        frame = source.set_index('StudyID') if 'StudyID' in source.columns else source.copy()
+    else:
+        key = (os.path.abspath(source), os.path.getmtime(source))
+        if key not in _loaded_annotations:
+            if source.endswith('.parquet'):
+                loaded = pd.read_parquet(source)
+            else:
+                loaded = pd.read_csv(source, dtype=str, keep_default_na=False, na_values=[''])
+            if 'StudyID' not in loaded.columns:
+                raise ValueError(f"Patient annotations in {source} have no StudyID column")
+            _loaded_annotations[key] = loaded.set_index('StudyID')
+        frame = _loaded_annotations[key]
+
+    missing = [col for col in PATIENT_ANNOTATION_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Patient annotations are missing the columns {missing} "
+                         f"(expected StudyID + {PATIENT_ANNOTATION_COLUMNS})")
+    if not frame.index.is_unique:
+        dupes = frame.index[frame.index.duplicated()].unique().tolist()
+        raise ValueError(f"Patient annotations list StudyIDs more than once: {dupes}")
+    return frame[PATIENT_ANNOTATION_COLUMNS]
 
 
 class RedcapProcessor:
-    def __init__(self, api_url, api_key):
+
+    # ---- Processing steps, in the order process() runs them ----
+    PIPELINE_STEPS = [
+        '_clean_data',
+        '_drop_irrelevant_columns',
+        '_replace_column_names',
+        '_clean_studyids',
+        '_filter_patients',
+        '_filter_screening_status',
+        '_process_vte_flags',
+        '_replace_missing_values',
+        '_process_comorbidities_complications',
+        '_assign_timepoints',
+        '_process_surgery_injury_dates',
+        '_times_to_analyses',
+        '_Process_AO_OTA',
+        # '_Process_CFS',
+        '_fill_patient_constants',
+        '_Process_fluids_given',
+        '_join_patient_annotations',
+        '_Process_Death_Withdrawals',
+        '_process_treatment',
+        '_process_ethnicity',
+        '_add_blood_transfusion',
+        '_add_study_names',
+        '_compute_cas',
+        '_remove_data_after_vte',
+        '_coerce_lab_types',
+        '_apply_categories',
+        '_build_records',
+    ]
+
+    # Steps with side effects beyond self.df; never restored from a checkpoint
+    UNCHECKPOINTED_STEPS = {'_build_records'}
+
+    # Step outputs besides self.df, stored with every checkpoint
+    CHECKPOINT_STATE = ['coercion_report', 'unparsed']
+
+    # Settings that change what the steps produce; part of every checkpoint key
+    CHECKPOINT_CONFIG = [
+        'replacement_dict', 'timepoint_dict', 'annotations', 'medications_postop', 'arth_fix',
+        'demographic_cols', 'lab_cols', 'lab_schema', 'patient_constant_cols',
+        'comorbidity_cols', 'categorical_cols', 'missing_values', 'after_vte_timepoints',
+    ]
+
+    def __init__(self, api_url, api_key, project=None, incremental=False, snapshot_dir='.redcap_snapshots',
+                 sync_overlap=timedelta(days=1), batch_size=None, max_workers=4, max_retries=3, retry_backoff=1.0,
+                 cache_dir=None, cache_ttl=timedelta(hours=12), checkpoint_dir=None,
+                 profile=False, profile_log=None, annotations=PATIENT_ANNOTATIONS):
         # Store API connection info
         self.api_url = api_url
         self.api_key = api_key
-        self.project = Project(api_url, api_key)
+        self.project = project if project is not None else Project(api_url, api_key)
+
+        # ---- Incremental export ----
+        # When enabled, the last raw export and its sync time are kept in snapshot_dir
+        # and only records changed since then are pulled from REDCap.
+        # The sync time is the local clock at the start of the export minus sync_overlap, so
+        # a server in another timezone (or a skewed clock) re-sends records instead of
+        # dropping them; re-sent rows are upserted, so the overlap only costs transfer.
+        self.incremental = incremental
+        self.snapshot_dir = snapshot_dir
+        self.sync_overlap = sync_overlap
+
+        # ---- Chunked export ----
+        # batch_size=None exports the project in one request; otherwise record IDs are
+        # exported in batches of batch_size on a pool of max_workers threads.
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # ---- Raw export cache ----
+        # cache_dir=None disables the cache; cache_ttl=None keeps cached exports until refresh=True.
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.export_kwargs = {'raw_or_label': 'label'}
+
+        # ---- Step checkpoints ----
+        # checkpoint_dir=None runs every step; otherwise each step's output frame is stored
+        # and process() resumes after the last step whose input and code are unchanged.
+        self.checkpoint_dir = checkpoint_dir
+
+        # ---- Step instrumentation ----
+        # profile=True records time/memory/shape per step in self.step_metrics;
+        # profile_log additionally appends each step as one JSON line to that file.
+        self.profile = profile
+        self.profile_log = profile_log
+        self.step_metrics = pd.DataFrame()
+
+        # Lab/TEG values that failed to parse as their lab_schema type (column, value, count)
+        self.coercion_report = pd.DataFrame(columns=['column', 'value', 'count'])
+        # Cells of self.df that held one of those values (a value was recorded, now NaN/NaT)
+        self.unparsed = pd.DataFrame()
+
+        # ---- Output table cache ----
+        # get_all_labs()/per-patient lookups are served from tables (each with a PatientIndex)
+        # that are rebuilt when self.df or self.records is reassigned or records are
+        # added/removed; call invalidate_cache() after editing records in place.
+        self._data_version = 0
+        self._table_cache = {}
 
         self.records = {}  # populated later
+        self.demographics = pd.DataFrame()  # one row per patient; records hold views into it
         self.df = pd.DataFrame()
 
+        # ---- REDCap missing codes; set to NaN in _replace_missing_values (after the VTE flags)
+        self.missing_values = ['None', '-999', '', 'NaN', 'Not applicable', '-2997']
+
         # ---- Column replacement ----
         self.replacement_dict = {
             ("patient_id", "record_id"): "StudyID",
@@ -184,26 +595,6 @@ class RedcapProcessor:
                         'Unscheduled Day 3', 'Unscheduled Day 4', 'Pre-Op (unsch. day 5)']
         }
 
-         # ---- PRE_OP_medication ----
-        self.medications_preop = {
-            **dict.fromkeys(
-                    ['HPA-001', 'HPA-004', 'HPA-008', 'HPA-009', 'HPA-010',
-                    'HPA-012', 'HPA-014', 'HPA-015', 'HPA-016', 'HPA-017', 'HPA-019',
-                    'HPA-020', 'HPA-021', 'HPA-022', 'HPA-024', 'HPA-026', 'HPA-028',
-                    'HPA-029', 'HPA-030', 'HPA-032', 'HPA-033', 'HPA-035', 'HPA-036',
-                    'HPA-038', 'HPA-039', 'HPA-042', 'HPA-043','HPA-048', 'HPA-050' ,
-                    'HPA-051','HPA-052','HPA-053', 'HPA-054', 'HPA-055', 'HPA-057', 'HPA-058', 'HPA-059','HPA-060','HPA-063',
-                    'THB-HPA-007','THB-HPA-013','THB-HPA-017','THB-HPA-025','THB-HPA-029','OTT-PATH-002','OTT-HPA-006',
-                    'TH-162', 'TH-170', 'TH-198', 'TH-212', 'TH-217', 
-                    'TH-225', 'TH-227', 'TH-236', 'TH-240','TH-255', 'TH-262', 'TH-267', 'TH-274', 'TH-284','TH-286',
-                    'TH-302', 'TF-121','TF-128', 'TPA-058','TPA-082','TPA-093' ], "DOAC"),
-            **dict.fromkeys(['TH-244'], 'Warfarin'),
-            **dict.fromkeys(['TH-006','TH-008','TH-011','TH-013','TH-023','TH-025','TH-026','TH-028','TH-031','TH-035','TH-038','TH-041','TH-046','TH-059','TH-066','TH-072','TH-082','TH-086','TH-090','TH-092','TH-093','TH-100',
-                             'TH-102','TH-105','TH-116','TH-126','TH-127','TH-128','TH-133','TH-139','TH-185','TH-258','TH-301','TH-305','TF-005','TF-038','TF-059','TF-071','TF-109','TF-121','TF-136','TPA-019', 'TPA-085',
-                             'TA-002','TA-008','TA-018','TA-022','TA-031','TA-045','TA-081','TA-112'],'ASA'),
-            **dict.fromkeys(['TH-004','TH-010','TH-075','TH-110'], 'No Info')
-        }
-
          # ---- POST_OP_medication ----
         # TF 042, TF 128 'TPA-010','TPA-058','TPA-082','TPA-093',TPA-100' are on DOAC post-operatively.
         # TF 027, TF 039, TF 042, TF 059, TF 073, TF 120, TF 128,  'TPA-055','TPA-056','TPA-058','TPA-073','TPA-082','TPA-089','TPA-095','TPA-097' are on DOAC at follow-up. 
@@ -250,18 +641,8 @@ class RedcapProcessor:
             ], 'Fixation')
         }
 
-        self.vte_timepoints = {'TH-003':'Week6','TH-082':'Week2','TH-088':'POD1','TH-201':'POD2','TH-227':'POD3','TH-253':'POD2','TH-261':'POD3','TH-264':'POD3','TH-271':'POD2',
-                               'TH-279':'POD2','TH-292':'POD3','TH-301':'POD3','TF-022':'Pre_Op','TF-027':'POD4','TF-069':'POD6','TF-073':'Week2','TF-075':'POD10','TF-085':'Week2',
-                               'TF-120':'POD2','TPA-001':'POD1','TPA-010':'POD5','TPA-011':'Week6','TPA-016':'Week2','TPA-019':'POD1','TPA-021':'POD4','TPA-026':'POD3','TPA-030':'Post_Op',
-                               'TPA-036':'POD1','TPA-061':'POD9','TPA-073':'POD10','TPA-081':'Pre_Op','TPA-095':'POD7','TPA-097':'POD10','TPA-100':'POD1','HPA-028':'POD3', 'TA-056':'POD2', 'TA-015':'Week10','UKA-02':'POD4'}
-        
-        self.comp_uti = { **dict.fromkeys(['TH-247','TH-262','TH-265','TH-289','TH-294',
-                                           'HPA-001','HPA-009','HPA-019','HPA-021','HPA-022','HPA-038','HPA-050','HPA-053',
-                                           'TF-124',
-                                           ### NO UTI in PELVIS 
-                                           ], 'Yes')}
-
-        
+        # ---- Pre_op_med/UTI/VTE_time per StudyID (see PATIENT_ANNOTATIONS); joined in one step
+        self.annotations = load_patient_annotations(annotations)
 
         # ---- Columns to be added to demographic or blood analyses
         self.demographic_cols = ['Study','StudyID','Death','Withdrawn','Age','Sex','BMI','Injury_date','Admission_date','Surgery_date','AO_OTA','Treatment','DVT','PE','VTE_type','VTE','VTE_time','comorb_diabetes','comorb_cancer',
@@ -271,67 +652,334 @@ class RedcapProcessor:
         
         self.lab_cols = ['Study','StudyID', 'Time','CAS','VTE_type','VTE','VTE_time','time_injury_rbc_hours','total_blood_rbc','blood_rbc_yn', 'blood_rbc', 'blood_date','rbc_timepoint', 'Hemoglobin', 'Creatinine', 'R_time', 'K_time','Alpha_Angle', 'MA', 'LY30', 'ACT','ADP-agg', 'ADP-inh','ADP-ma',
                          'AA-agg','AA-inh','AA-ma','CFF-MA','ACTF-MA','CFF-FLEV','CFF-A10','Draw_date_lab', 'Draw_date_teg','Pre_op_med','time_injury_to_surgery_hours'] #,'fluids_given'
-        
+
+        # ---- Type of lab columns: coerced once in _coerce_lab_types ('float' -> float64,
+        #      'datetime' -> datetime64[ns]); columns not listed are kept as object
+        self.lab_schema = {
+            **dict.fromkeys(['CAS', 'time_injury_rbc_hours', 'total_blood_rbc', 'blood_rbc', 'Hemoglobin', 'Creatinine',
+                             'R_time', 'K_time', 'Alpha_Angle', 'MA', 'LY30', 'ACT', 'ADP-agg', 'ADP-inh', 'ADP-ma',
+                             'AA-agg', 'AA-inh', 'AA-ma', 'CFF-MA', 'ACTF-MA', 'CFF-FLEV', 'CFF-A10',
+                             'time_injury_to_surgery_hours'], 'float'),
+            **dict.fromkeys(['blood_date', 'Draw_date_lab', 'Draw_date_teg'], 'datetime'),
+        }
+
+        # ---- Comorbidities/complications: 'Yes' for every row of a patient with any 'Yes'
+        self.comorbidity_cols = ['comorb_diabetes', 'comorb_cancer', 'comorb_cardiovascular', 'comorb_pulmonary', 'comorb_stroke',
+                                 'comp_pulmonary', 'comp_cardiovascular', 'comp_infection', 'comp_surgical']
+
+        # ---- Stored as categoricals (listed categories first); Time/VTE_time on TIME_AXIS
+        self.categorical_cols = {
+            'StudyID': [], 'Study': [], 'Pre_op_med': [],
+            **dict.fromkeys(['VTE', 'DVT', 'PE', 'blood_rbc_yn'] + self.comorbidity_cols, ['No', 'Yes']),
+        }
+
+        # ---- Timepoints compared in _remove_data_after_vte (by their TIME_AXIS position): draws at
+        #      one of these after a VTE at one of these are blanked. PFD1-4, Intra_Op and Month6
+        #      are not listed, so they are never blanked and a VTE there blanks nothing.
+        self.after_vte_timepoints = ['Admission', 'Pre_Op', 'Post_Op', 'POD1', 'POD2', 'POD3', 'POD4', 'POD5',
+                                     'POD6', 'POD7', 'POD8', 'POD9', 'POD10', 'Week2', 'Week4', 'Week6', 'Week10',
+                                     'Month3', 'Unscheduled']
+
+        # ---- Recorded once per patient; filled to every row of that StudyID
+        self.patient_constant_cols = ['anesthesia_type', 'TXA_type', 'artho_type', 'intraop_bloodloss', 'intraop_fluids',
+                                      'surgical_approach', 'LOS']
+
         # Placeholder for processed DataFrame
         self.df = None
 
+    def __getstate__(self):
+        # Pickled copies (e.g. sent to a worker process) carry the data but not the API connection
+        state = self.__dict__.copy()
+        state['project'] = None
+        return state
+
     # ----------------------------------------------------------
     # MASTER FUNCTION (calls all modular steps)
     # ----------------------------------------------------------
-    def fetch_and_process(self):
-        self._fetch_records()
-        self._clean_data()
-        self._drop_irrelevant_columns()
-        self._replace_column_names()
-        self._clean_studyids()
-        self._filter_patients()
-        self._filter_screening_status()
-        self._process_vte_flags()
-        self._process_vte_timepoints()
-        self._replace_missing_values()
-        self._process_comorbidities_complications()
-        self._assign_timepoints()
-        self._process_surgery_injury_dates()
-        self._times_to_analyses()
-        self._Process_AO_OTA()
-        # self._Process_CFS()
-        self._Process_anesthesia_type()
-        self._Process_txa_type()
-        self._Process_artho_type()
-        self._Process_intraop_bloodloss()
-        self._Process_intraop_fluids()
-        self._Process_surgical_approach()
-        self._Process_fluids_given()
-        self._Process_length_of_stay()
-        self._Process_medication()
-        self._Process_UTI()
-        self._Process_Death_Withdrawals()
-        self._process_treatment()
-        self._process_ethnicity()
-        self._add_blood_transfusion()
-        self._add_study_names()
-        self._compute_cas()
-        self._remove_data_after_vte()
-        self._build_records()
+    def fetch_and_process(self, refresh=False):
+        self._fetch_records(refresh=refresh)
+        return self.process()
 
+    def process(self):
+        """Run PIPELINE_STEPS on the already fetched self.df."""
+        steps = self.PIPELINE_STEPS
+
+        if self.checkpoint_dir:
+            keys = self._checkpoint_keys()
+            start = self._restore_checkpoint(keys)
+        else:
+            keys = [None] * len(steps)
+            start = 0
+
+        metrics = []
+        start_tracing = self.profile and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+
+        try:
+            for name, key in list(zip(steps, keys))[start:]:
+                if self.profile:
+                    metrics.append(self._run_profiled_step(name))
+                else:
+                    getattr(self, name)()
+                if key is not None:
+                    self._save_checkpoint(key)
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+            if self.profile:
+                self.step_metrics = pd.DataFrame(metrics)
 
         return self.df
 
+    # ----------------------------------------------------------
+    # Instrumentation
+    # ----------------------------------------------------------
+    @staticmethod
+    def _peak_rss_mb():
+        if resource is None:
+            return np.nan
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes on Linux
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+    def _run_profiled_step(self, name):
+        """Run one step and return its timing, memory and shape metrics."""
+        rows_before, cols_before = self.df.shape
+        tracemalloc.reset_peak()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        rss_before = self._peak_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+
+        getattr(self, name)()
+
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        _, traced_peak = tracemalloc.get_traced_memory()
+        rss_after = self._peak_rss_mb()
+        rows_after, cols_after = self.df.shape
+
+        step = {
+            'step': name,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'tracemalloc_peak_mb': (traced_peak - traced_before) / 1024 ** 2,
+            'peak_rss_mb': rss_after,
+            'peak_rss_delta_mb': rss_after - rss_before,
+            'rows_before': rows_before,
+            'cols_before': cols_before,
+            'rows_after': rows_after,
+            'cols_after': cols_after,
+            'frame_mb': self.df.memory_usage(deep=True).sum() / 1024 ** 2,
+        }
+
+        if self.profile_log:
+            with open(self.profile_log, 'a') as f:
+                f.write(json.dumps({'project': self._project_key(), 'time': datetime.now().isoformat(), **step}) + '\n')
+
+        return step
+
+    # ----------------------------------------------------------
+    # Checkpoints
+    # ----------------------------------------------------------
+    @staticmethod
+    def _frame_fingerprint(df):
+        """Content hash of a DataFrame (columns, dtypes and values)."""
+        h = hashlib.sha1()
+        h.update(repr(list(df.columns)).encode())
+        h.update(repr([str(t) for t in df.dtypes]).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        return h.hexdigest()
+
+    def _step_code_hash(self, name):
+        """Hash of the step method's source (covers steps overridden outside this module)."""
+        return hashlib.sha1(inspect.getsource(getattr(type(self), name)).encode()).hexdigest()
+
+    @staticmethod
+    def _module_code_hash():
+        """Hash of the source of the modules holding the helpers the steps call (as_category, parsers, ...)."""
+        h = hashlib.sha1()
+        for module in (sys.modules[__name__], column_helpers, time_axis):
+            h.update(inspect.getsource(module).encode())
+        return h.hexdigest()
+
+    def _checkpoint_keys(self):
+        """
+        One key per step: hash of the step's input key plus the step's code.
+        The first input key covers the fetched frame, CHECKPOINT_CONFIG and the module source,
+        so editing any helper invalidates every checkpoint rather than loading stale output.
+        """
+        config = repr([
+            self._frame_fingerprint(value) if isinstance(value, pd.DataFrame) else value
+            for value in (getattr(self, attr, None) for attr in self.CHECKPOINT_CONFIG)
+        ])
+        key = hashlib.sha1((self._frame_fingerprint(self.df) + config + self._module_code_hash()).encode()).hexdigest()
+
+        keys = []
+        for name in self.PIPELINE_STEPS:
+            if name in self.UNCHECKPOINTED_STEPS:
+                keys.append(None)
+                continue
+            key = hashlib.sha1((key + self._step_code_hash(name)).encode()).hexdigest()
+            keys.append(key)
+        return keys
+
+    def _checkpoint_path(self, key):
+        return os.path.join(self.checkpoint_dir, key + '.pkl')
+
+    def _restore_checkpoint(self, keys):
+        """Load the latest stored step output; returns the index of the first step to run."""
+        for i in range(len(keys) - 1, -1, -1):
+            if keys[i] is not None and os.path.exists(self._checkpoint_path(keys[i])):
+                state = pd.read_pickle(self._checkpoint_path(keys[i]))
+                self.df = state.pop('df')
+                for attr, value in state.items():
+                    setattr(self, attr, value)
+                print(f"- Steps 02-{i + 2:02d} -Restored from checkpoint")
+                return i + 1
+        return 0
+
+    def _save_checkpoint(self, key):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        state = {'df': self.df, **{attr: getattr(self, attr) for attr in self.CHECKPOINT_STATE}}
+        with open(self._checkpoint_path(key), 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
     # ----------------------------------------------------------
     # STEP 1: Fetch records
     # ----------------------------------------------------------
     
-    def _fetch_records(self):
-        records_data = self.project.export_records(raw_or_label='label')
-        self.df = pd.DataFrame(records_data)
+    def _fetch_records(self, refresh=False):
+        cache_path = self._cache_path() if self.cache_dir else None
+
+        if cache_path and not refresh and self._cache_is_fresh(cache_path):
+            self.df = pd.read_parquet(cache_path)
+            print('- Step 01 -Data loaded from cache')
+            return
+
+        if self.incremental:
+            self.df = self._fetch_incremental()
+        else:
+            self.df = self._export_frame()
+
+        if cache_path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.df.to_parquet(cache_path, index=False)
         print('- Step 01 -Data Fetched')
 
+    def _project_key(self):
+        """Short, stable identifier of this project (the API token itself is never written to disk)."""
+        return hashlib.sha1(f"{self.api_url}|{self.api_key}".encode()).hexdigest()[:16]
+
+    def _cache_path(self):
+        """Parquet file for the raw export, keyed by API URL, project and export arguments."""
+        key = json.dumps({'api_url': self.api_url, 'project': self._project_key(), 'export': self.export_kwargs},
+                         sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest()[:16] + '.parquet')
+
+    def _cache_is_fresh(self, cache_path):
+        if not os.path.exists(cache_path):
+            return False
+        if self.cache_ttl is None:
+            return True
+        age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(cache_path))
+        return age < self.cache_ttl
+
+    def _export_frame(self, **filters):
+        """
+        Export records (label values) as a DataFrame. With batch_size set, the record IDs
+        are listed first and exported in parallel batches; rows keep the single-export order.
+        """
+        if not self.batch_size:
+            return pd.DataFrame(self._export_with_retry(**self.export_kwargs, **filters))
+
+        record_field = self.project.def_field
+        id_rows = self._export_with_retry(fields=[record_field], raw_or_label='raw', **filters)
+        record_ids = list(dict.fromkeys(row[record_field] for row in id_rows))
+        if not record_ids:
+            return pd.DataFrame()
+
+        batches = [record_ids[i:i + self.batch_size] for i in range(0, len(record_ids), self.batch_size)]
+
+        def export_batch(batch):
+            return pd.DataFrame(self._export_with_retry(records=batch, **self.export_kwargs))
+
+        # pool.map yields results in submission order
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            frames = list(pool.map(export_batch, batches))
+
+        print(f"- Step 01 -Exported {len(record_ids)} records in {len(batches)} batches")
+        return pd.concat(frames, ignore_index=True)
+
+    def _export_with_retry(self, **export_kwargs):
+        """project.export_records with exponential backoff on API/network errors."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.project.export_records(**export_kwargs)
+            except (RedcapError, requests.exceptions.RequestException):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _snapshot_paths(self):
+        """Raw snapshot (.pkl) and sync state (.json) paths for this project."""
+        base = os.path.join(self.snapshot_dir, self._project_key())
+        return base + '.pkl', base + '.json'
+
+    def _fetch_incremental(self):
+        """
+        Export only records created/modified since the last sync and merge them
+        into the raw snapshot on disk. The first run (no snapshot yet) is a full export.
+        Records deleted in REDCap are not detected; remove the snapshot to force a full export.
+        """
+        snapshot_path, state_path = self._snapshot_paths()
+        sync_from = datetime.now() - self.sync_overlap
+
+        if os.path.exists(snapshot_path) and os.path.exists(state_path):
+            snapshot = pd.read_pickle(snapshot_path)
+            with open(state_path) as f:
+                last_sync = datetime.strptime(json.load(f)['last_sync'], '%Y-%m-%d %H:%M:%S')
+
+            changed = self._export_frame(date_begin=last_sync)
+            df = self._merge_snapshot(snapshot, changed)
+            print(f"- Step 01 -{len(changed)} changed rows since {last_sync:%Y-%m-%d %H:%M:%S}")
+        else:
+            df = self._export_frame()
+            print('- Step 01 -No snapshot found, full export')
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        df.to_pickle(snapshot_path)
+        with open(state_path, 'w') as f:
+            json.dump({'last_sync': sync_from.strftime('%Y-%m-%d %H:%M:%S')}, f)
+
+        return df
+
+    def _merge_snapshot(self, snapshot, changed):
+        """Upsert changed rows into the snapshot by record_id / event / repeat instance."""
+        if changed.empty:
+            return snapshot
+
+        record_field = self.project.def_field
+        keys = [k for k in [record_field, 'redcap_event_name', 'redcap_repeat_instrument', 'redcap_repeat_instance']
+                if k in changed.columns and k in snapshot.columns]
+
+        # Drop the old version of every changed row, then append the new ones
+        changed_keys = pd.MultiIndex.from_frame(changed[keys].astype(str))
+        snapshot_keys = pd.MultiIndex.from_frame(snapshot[keys].astype(str))
+        merged = pd.concat([snapshot[~snapshot_keys.isin(changed_keys)], changed], ignore_index=True)
+
+        # Keep each record's rows together, records in the order they were first seen
+        record_order = pd.Index(pd.unique(pd.concat([snapshot[record_field], changed[record_field]])))
+        position = record_order.get_indexer(merged[record_field])
+        merged = merged.iloc[np.argsort(position, kind='stable')].reset_index(drop=True)
+
+        return merged
+
     # ----------------------------------------------------------
     # STEP 2: Clean basic data
     # ----------------------------------------------------------
     def _clean_data(self):
-        # Replace empty strings with NaN
-        self.df = self.df.replace(r'^\s*$', np.nan, regex=True)
+        # Replace empty (or whitespace-only) strings with NaN
+        self.df = mask_object_values(self.df, lambda v: isinstance(v, str) and not v.strip())
         print('- Step 02 -Processed')
 
     # ----------------------------------------------------------
@@ -356,13 +1004,13 @@ class RedcapProcessor:
     # ----------------------------------------------------------
     # STEP 4: Replace columns with replacement dictionary
     # ----------------------------------------------------------
+    @property
+    def aliases(self):
+        """Compiled replacement_dict/timepoint_dict (shared between processors with the same tables)."""
+        return AliasResolver.for_tables(self.replacement_dict, self.timepoint_dict)
+
     def _replace_column_names(self):
-        col_mapping = {}
-        for keys, standard_name in self.replacement_dict.items():
-            for k in keys:
-                if k in self.df.columns:
-                    col_mapping[k] = standard_name
-        self.df = self.df.rename(columns=col_mapping)
+        self.df = self.aliases.rename_columns(self.df)
         print("- Step 04 -Columns renamed")
   
     # ----------------------------------------------------------
@@ -372,7 +1020,7 @@ class RedcapProcessor:
         if 'StudyID' not in self.df.columns:
             return
         
-        self.df = self.df.replace({'Participant Withdrawn': np.nan})
+        self.df = mask_object_values(self.df, lambda v: v == 'Participant Withdrawn')
         self.df['StudyID'] = self.df['StudyID'].astype(str).str.strip()
         print ('- Step 05 -Processed')
 
@@ -419,14 +1067,13 @@ class RedcapProcessor:
     def _filter_screening_status(self):
         # keep eligible → enrolled OR any UKA-* StudyID
         if 'enrolled_yn' in self.df.columns:
-            self.df['StudyID'] = self.df['StudyID'].astype(str).str.strip()
-
+            # StudyID is already stripped strings (step 05)
             enrolled_mask = (
                 self.df.groupby('StudyID')['enrolled_yn']
                 .transform(lambda x: x.eq('Enrolled').any())
             )
 
-            uka_mask = self.df['StudyID'].astype(str).str.startswith('UKA-')
+            uka_mask = self.df['StudyID'].str.startswith('UKA-')
 
             self.df = self.df[enrolled_mask | uka_mask]
 
@@ -513,26 +1160,15 @@ class RedcapProcessor:
 
         
 
-    # ----------------------------------------------------------
-    # STEP 9: VTE_timepoints
-    # ----------------------------------------------------------
-    def _process_vte_timepoints(self):
-        self.df['VTE_time'] = (
-            self.df['StudyID']
-            .map(self.vte_timepoints)
-            .where(lambda x: x.notna())
-        )
-        print("- Step 09 -Added VTE_timepoints")
-      
     # ----------------------------------------------------------
     # STEP 10: Missing Values
     # ----------------------------------------------------------
     def _replace_missing_values(self):
-        """Convert common REDCap missing codes to NaN"""
-        missing_values = ['None', '-999', '', 'NaN','Not applicable','-2997', None] #'Not applicable'
-        self.df = self.df.replace(missing_values, np.nan)
+        """Convert common REDCap missing codes (missing_values) and None to NaN"""
+        missing = set(self.missing_values)
+        self.df = mask_object_values(self.df, lambda v: v in missing, none_to_nan=True)
         print('- Step 10 -Processed')
-       
+
     # ----------------------------------------------------------
     # STEP 11: Process comorbidities
     # ----------------------------------------------------------
@@ -541,40 +1177,25 @@ class RedcapProcessor:
         self.df['StudyID'] = self.df['StudyID'].astype(str).str.strip().str.upper()
         self.df = self.df.sort_values('StudyID').reset_index(drop=True)
 
-        COMORBIDITY_COMPLICATIONS = [
-            'comorb_diabetes','comorb_cancer','comorb_cardiovascular',
-            'comorb_pulmonary','comorb_stroke',
-            'comp_pulmonary','comp_cardiovascular','comp_infection','comp_surgical'
-        ]
+        # Values that count as 'Yes' (Unchecked/No/Other/missing all end up 'No')
+        yes_values = ['Checked', 'Yes', 'Yes*']
 
-        # Replace map
-        replace_map = {
-            'Checked': 'Yes',
-            'Unchecked': 'No',
-            'Yes*': 'Yes',
-            'Other': np.nan,
-            'Yes': 'Yes',
-            'No': 'No',
-            None: 'No'
-        }
-
-        for col in COMORBIDITY_COMPLICATIONS:
-            if col in self.df.columns:
-               
-               self.df.loc[:, col] = self.df.loc[:, col].astype(str).replace('nan', np.nan)  # convert to string, handle NaN
-               self.df.loc[:, col] = self.df.loc[:, col].str.strip()            # string operations
-               self.df.loc[:, col] = self.df.loc[:, col].replace(replace_map)              
-            else:
-                self.df.loc[:, col] = np.nan
+        for col in self.comorbidity_cols:
+            if col not in self.df.columns:
+                self.df[col] = np.nan
 
+        # Normalize the whole block in one pass (positions, so duplicated names are covered)
+        positions = [i for i, c in enumerate(self.df.columns) if c in self.comorbidity_cols]
+        values = self.df.iloc[:, positions].to_numpy(dtype=str)
+        is_yes = np.isin(np.char.strip(values), yes_values)
 
+        # Any 'Yes' per StudyID, computed once for the block and broadcast back to the rows
+        codes, _ = pd.factorize(self.df['StudyID'])
+        any_yes = pd.DataFrame(is_yes).groupby(codes).any().to_numpy()[codes]
 
-        # Count 'Yes' per StudyID and set all accordingly
-        for col in COMORBIDITY_COMPLICATIONS:
-            self.df[col] = self.df.groupby('StudyID')[col].transform(lambda x: 'Yes' if (x == 'Yes').sum() >= 1 else 'No')
-
-        for col in COMORBIDITY_COMPLICATIONS:            
-            self.df[col]=self.df[col].replace(np.nan,'No')
+        flags = np.where(any_yes, 'Yes', 'No').astype(object)
+        for j, pos in enumerate(positions):
+            self.df.isetitem(pos, flags[:, j])
 
         print("- Step 11 -Processed comorbidities and complications")
         
@@ -593,15 +1214,12 @@ class RedcapProcessor:
 
 
         if 'Time' in self.df.columns:
-            # Create a lowercase mapping for all variations
-            timepoint_dict_lower = {k.lower(): v for v_list in self.timepoint_dict.values() for k in v_list for v in [list(self.timepoint_dict.keys())[list(self.timepoint_dict.values()).index(v_list)]]}
-
             # Map using lowercase column values
             if 'unsc' in self.df['Time']:
                 self.df['Time']='Unscheuled'
 
             else:
-                self.df['Time'] = self.df['Time'].astype(str).str.lower().map(timepoint_dict_lower)
+                self.df['Time'] = self.aliases.map_timepoints(self.df['Time'])
 
         print("- Step 12 -Processed timepoints")
 
@@ -617,21 +1235,18 @@ class RedcapProcessor:
             if existing_surg_cols:
                 # Merge into one column using first non-null value
                 self.df['Surgery_date'] = self.df[existing_surg_cols].bfill(axis=1).iloc[:, 0]
-                self.df['Surgery_date'] = pd.to_datetime(self.df['Surgery_date'], errors='coerce')
+                self.df['Surgery_date'] = parse_redcap_datetimes(self.df['Surgery_date'])
 
 
 
         if 'adm_injury_time' in self.df.columns and 'Injury_date' in self.df.columns:
-            self.df['Injury_date'] = pd.to_datetime(self.df['Injury_date'].astype(str) + ' ' + self.df['adm_injury_time'].astype(str),
-            errors='coerce')
+            self.df['Injury_date'] = parse_redcap_datetimes(self.df['Injury_date'].astype(str) + ' ' + self.df['adm_injury_time'].astype(str))
 
         if 'time_injury' in self.df.columns and 'Injury_date' in self.df.columns:
-            self.df['Injury_date'] = pd.to_datetime(self.df['Injury_date'].astype(str) + ' ' + self.df['time_injury'].astype(str),
-            errors='coerce')
+            self.df['Injury_date'] = parse_redcap_datetimes(self.df['Injury_date'].astype(str) + ' ' + self.df['time_injury'].astype(str))
 
         if 'intraop_time_surg' in self.df.columns and 'Surgery_date' in self.df.columns:
-            self.df['Surgery_date'] = pd.to_datetime(self.df['Surgery_date'].astype(str) + ' ' + self.df['intraop_time_surg'].astype(str),
-            errors='coerce')
+            self.df['Surgery_date'] = parse_redcap_datetimes(self.df['Surgery_date'].astype(str) + ' ' + self.df['intraop_time_surg'].astype(str))
 
         print("- Step 13 -Cleaned injury/surgery dates")
 
@@ -651,21 +1266,17 @@ class RedcapProcessor:
 
         if 'Draw_date' in self.df.columns:
             # Parse Draw_date safely
-            parsed_draw = pd.to_datetime(self.df['Draw_date'], errors='coerce')
+            parsed_draw = parse_redcap_datetimes(self.df['Draw_date'])
 
-            # Identify if Draw_date has a time (non-midnight)
-            has_time = parsed_draw.dt.time.astype(str) != "00:00:00"
+            # Identify if Draw_date has a time (non-midnight); unparsable dates count as timed (-> NaT)
+            has_time = parsed_draw.isna() | (parsed_draw != parsed_draw.dt.normalize())
 
             # Ensure time columns exist
             if 'teg_time' not in self.df.columns:
                 self.df['teg_time'] = pd.NA
-            teg_exists = True
 
             # If lab_time missing entirely, mark flag
             lab_time_exists = 'lab_time' in self.df.columns
-            if not lab_time_exists:
-                self.df['lab_time'] = pd.NA  # create column if missing
-                self.df['lab_time'] = self.df['lab_time'].fillna('00:00:00').astype(str) ########## ADDED DEC 4
 
             # Replace missing times with midnight
             self.df['teg_time'] = self.df['teg_time'].fillna('00:00:00').astype(str)
@@ -675,56 +1286,22 @@ class RedcapProcessor:
                 # Replace only rows where teg_time is '00:00'
                 self.df.loc[self.df['teg_time'] == '00:00:00', 'teg_time'] = self.df['lab_time']
             else:
-                self.df['lab_time'] = self.df['teg_time'].fillna('00:00:00').astype(str)
+                # If lab_time column missing entirely → fall back to teg_time
+                self.df['lab_time'] = self.df['teg_time']
 
-            # Define fallback date (lab_date_visit if Draw_date missing)
+            # Draw day: lab_date_visit where given, else Draw_date
             if 'lab_date_visit' in self.df.columns:
-                fallback_dates = pd.to_datetime(self.df['lab_date_visit'], errors='coerce')
+                fallback_dates = parse_redcap_datetimes(self.df['lab_date_visit'])
             else:
-                fallback_dates = pd.Series([pd.NaT] * len(self.df), index=self.df.index)
+                fallback_dates = pd.Series(pd.NaT, index=self.df.index, dtype='datetime64[ns]')
+            draw_day = fallback_dates.combine_first(parsed_draw).dt.normalize()
 
-            # Build Draw_date_teg
-            self.df['Draw_date_teg'] = np.where(
-                has_time,
-                parsed_draw.astype(str),
-                (
-                    fallback_dates.combine_first(parsed_draw).dt.strftime('%Y-%m-%d')
-                    + ' '
-                    + self.df['teg_time']
-                )
-            )
+            # Timed Draw_date as is; otherwise draw day + teg/lab time of day
+            self.df['Draw_date_teg'] = parsed_draw.where(has_time, draw_day + parse_time_of_day(self.df['teg_time']))
+            self.df['Draw_date_lab'] = parsed_draw.where(has_time, draw_day + parse_time_of_day(self.df['lab_time']))
 
-            # Build Draw_date_lab
-            if lab_time_exists:
-                # If lab_time exists, only use it; leave NaT if missing
-                self.df['Draw_date_lab'] = np.where(
-                    has_time,
-                    parsed_draw.astype(str),
-                    np.where(
-                        self.df['lab_time'].notna() & (self.df['lab_time'] != 'NaT'),
-                        fallback_dates.combine_first(parsed_draw).dt.strftime('%Y-%m-%d')
-                        + ' ' + self.df['lab_time'],
-                        np.nan  # leave missing as NaT
-                    )
-                )
-            else:
-                # If lab_time column missing entirely → fallback to teg_time
-                self.df['Draw_date_lab'] = np.where(
-                    has_time,
-                    parsed_draw.astype(str),
-                    (
-                        fallback_dates.combine_first(parsed_draw).dt.strftime('%Y-%m-%d')
-                        + ' '
-                        + self.df['teg_time']
-                    )
-                )
-           
             # Hemoglobin consistency rules
 
-            # Ensure Draw_date_lab and Draw_date_teg are proper datetimes
-            self.df['Draw_date_lab'] = pd.to_datetime(self.df['Draw_date_lab'], errors='coerce')
-            self.df['Draw_date_teg'] = pd.to_datetime(self.df['Draw_date_teg'], errors='coerce')
-
             # If Hemoglobin is missing → Draw_date_lab should be missing too
             if 'blood_rbc' not in self.df.columns:
                 self.df['blood_rbc'] = 'GOLPIRA'
@@ -742,12 +1319,11 @@ class RedcapProcessor:
             
             if 'lab_date_visit' in self.df.columns:
                 
-                self.df['Draw_date_lab'] = pd.to_datetime(self.df['Draw_date_lab'], errors='coerce')
-                self.df['lab_date_visit'] = pd.to_datetime(self.df['lab_date_visit'], errors='coerce')
+                self.df['lab_date_visit'] = fallback_dates
 
-                self.df['lab_time'] = self.df.get('lab_time', '00:00')
-                self.df['lab_time'] = self.df['lab_time'].fillna('00:00')
-                self.df['lab_time'] = self.df['lab_time'].apply(lambda x: x if len(x.split(':'))==3 else x + ':00')
+                # HH:MM -> HH:MM:00
+                lab_time = self.df['lab_time']
+                self.df['lab_time'] = lab_time.where(lab_time.str.count(':') == 2, lab_time + ':00')
 
                 # 2️⃣ Convert lab_time to timedelta
                 self.df['lab_time_td'] = pd.to_timedelta(self.df['lab_time'])
@@ -765,7 +1341,7 @@ class RedcapProcessor:
     # ----------------------------------------------------------
     def _Process_AO_OTA(self):
         if {'ota_type_61', 'ota_type_62'}.issubset(self.df.columns):
-            self.df['AO_OTA'] = (self.df[['ota_type_61', 'ota_type_62']].apply(lambda x: '/'.join(x.dropna().astype(str)), axis=1).replace('', np.nan))
+            self.df['AO_OTA'] = join_non_null(self.df, ['ota_type_61', 'ota_type_62'])
 
         print("- Step 15 -Cleaned AO_OTA classification --> NEED AHDMED'S INPUT")
 
@@ -823,137 +1399,33 @@ class RedcapProcessor:
 
             # # Step 2: merge into single CFS_score (first non-NaN per row)
             # self.df["CFS_score"] = self.df[existing_cols].bfill(axis=1).iloc[:, 0]
+            # # (or every label that is set: join_non_null(self.df, existing_cols))
 
             # print("CFS_score value counts:")
             # print(self.df["CFS_score"].value_counts())
         
 
 
-    def _Process_anesthesia_type(self):
-        if 'anesthesia_type' in self.df.columns:
-            # Step 1: get indices for rows with valid StudyID
-            valid_idx = self.df[self.df['StudyID'].notna()].index
-            
-            # Step 2: fill only within valid StudyID groups
-            filled = self.df.loc[valid_idx].groupby('StudyID')['anesthesia_type'].apply(lambda x: x.ffill().bfill())
-            
-            # Step 3: assign back to original indices
-            self.df.loc[filled.index, 'anesthesia_type'] = filled
-
-            print("- Step 16 -Anesthesia type processed")
-
-        else:
-            print("- Step 16 -SKIPPED- anesthesia_type")
-
-
-    def _Process_txa_type(self):
-        if 'TXA_type' in self.df.columns:
-            # Step 1: get indices for rows with valid StudyID
-            valid_idx = self.df[self.df['StudyID'].notna()].index
-            
-            # Step 2: fill only within valid StudyID groups
-            filled = self.df.loc[valid_idx].groupby('StudyID')['TXA_type'].apply(lambda x: x.ffill().bfill())
-            
-            # Step 3: assign back to original indices
-            self.df.loc[filled.index, 'TXA_type'] = filled
-
-            print("- Step 17 -TXA type processed")
-        
-        else:
-            print("- Step 17 -SKIPPED- TXA_type")
-
-
-    def _Process_artho_type(self):
-        if 'artho_type' in self.df.columns:
-            # Step 1: get indices for rows with valid StudyID
-            valid_idx = self.df[self.df['StudyID'].notna()].index
-            
-            # Step 2: fill only within valid StudyID groups
-            filled = self.df.loc[valid_idx].groupby('StudyID')['artho_type'].apply(lambda x: x.ffill().bfill())
-            
-            # Step 3: assign back to original indices
-            self.df.loc[filled.index, 'artho_type'] = filled
-
-            print("- Step 18 -Arthoplasty type processed")
-
-        else:
-            print("- Step 18 -SKIPPED-_Process_artho_type")
-
-
-    def _Process_intraop_bloodloss(self):
-        if 'intraop_bloodloss' in self.df.columns:
-            # rows with valid StudyID
-            valid_idx = self.df['StudyID'].notna()
-
-            # fill within each StudyID while preserving original index
-            self.df.loc[valid_idx, 'intraop_bloodloss'] = (
-                self.df.loc[valid_idx]
-                .groupby('StudyID')['intraop_bloodloss']
-                .transform(lambda x: x.ffill().bfill())
-            )
-
-            print("- Step 19 -Intraoperative blood loss processed")
-
-        else:
-            print("- Step 19 -SKIPPED- intraop_bloodloss")
-
-  
-
-
-    def _Process_intraop_fluids(self):
-        if 'intraop_fluids' in self.df.columns:
-            # Step 1: get indices for rows with valid StudyID
-            valid_idx = self.df[self.df['StudyID'].notna()].index
-            
-            # Step 2: fill only within valid StudyID groups
-            filled = self.df.loc[valid_idx].groupby('StudyID')['intraop_fluids'].transform(lambda x: x.ffill().bfill())
-            
-            # Step 3: assign back to original indices
-            self.df.loc[filled.index, 'intraop_fluids'] = filled
-
-            print("- Step 20 -Intraoperative fluids processed")
-
-        else:
-            print("- Step 20 -SKIPPED- intraop_fluids")
-
-
-
-    def _Process_surgical_approach(self):
-        if 'surgical_approach' in self.df.columns:
-            # Step 1: get indices for rows with valid StudyID
-            valid_idx = self.df[self.df['StudyID'].notna()].index
-            
-            # Step 2: fill only within valid StudyID groups
-            filled = self.df.loc[valid_idx].groupby('StudyID')['surgical_approach'].transform(lambda x: x.ffill().bfill())
-            
-            # Step 3: assign back to original indices
-            self.df.loc[filled.index, 'surgical_approach'] = filled
-
-            print("- Step 21 -Surgical Approach processed")
-
-        else:
-            print("- Step 21 -SKIPPED- surgical_approach")
-
-
-    def _Process_length_of_stay(self):
-            if 'LOS' in self.df.columns:
-                # Step 1: get indices for rows with valid StudyID
-                valid_idx = self.df[self.df['StudyID'].notna()].index
-                
-                # Step 2: fill only within valid StudyID groups
-                filled = self.df.loc[valid_idx].groupby('StudyID')['LOS'].transform(lambda x: x.ffill().bfill())
-                
-                # Step 3: assign back to original indices
-                self.df.loc[filled.index, 'LOS'] = filled
-
-                print("- Step 22 -LOS processed")
-
-            else:
-                print("- Step 22 -SKIPPED- LOS")
-
+    # ----------------------------------------------------------
+    # STEP 16: Patient-level constants (anesthesia, TXA, LOS, ...)
+    # ----------------------------------------------------------
+    def _fill_patient_constants(self):
+        """Forward/back-fill every column in patient_constant_cols within each StudyID, in one groupby."""
+        cols = [c for c in self.patient_constant_cols if c in self.df.columns]
+        if not cols:
+            print("- Step 16 -SKIPPED- patient-level constants")
+            return
 
+        # Positions rather than names, so duplicated column names are filled too
+        positions = [i for i, c in enumerate(self.df.columns) if c in cols]
+        valid = self.df['StudyID'].notna().to_numpy()
+        keys = self.df.loc[valid, 'StudyID']
 
+        block = self.df.iloc[valid, positions]
+        filled = block.groupby(keys).ffill().groupby(keys).bfill()
+        self.df.iloc[valid, positions] = filled.to_numpy()
 
+        print(f"- Step 16 -Filled patient-level constants: {', '.join(cols)}")
 
 
     def _Process_fluids_given(self):
@@ -994,31 +1466,21 @@ class RedcapProcessor:
 
      
     # ----------------------------------------------------------
-    # STEP 17: Process Medication
+    # STEP 17: Join patient annotations (Pre_op_med, UTI, VTE_time)
     # ----------------------------------------------------------
-    def _Process_medication(self):
-        self.df['Pre_op_med'] = self.df['StudyID'].map(self.medications_preop)
-
-        # Step 2: Identify missing after mapping
-        missing_mask = self.df['Pre_op_med'].isna()
-
-        # Step 3: For missing AND not Arthoplasty → default LMWH
-        arthro_mask = self.df['StudyID'].str.startswith(('TA-','UKA-'))
+    def _join_patient_annotations(self):
+        # One lookup of every row's StudyID; only the annotation columns are written (no frame copy)
+        joined = self.annotations.reindex(self.df['StudyID'].to_numpy())
+        for col in joined.columns:
+            self.df[col] = joined[col].to_numpy()
 
-        self.df.loc[missing_mask & ~arthro_mask, 'Pre_op_med'] = 'LMWH'
+        # Not annotated: LMWH before surgery (arthroplasty studies excepted) and no UTI
+        missing_med = self.df['Pre_op_med'].isna() & ~self.df['StudyID'].str.startswith(('TA-', 'UKA-'))
+        self.df.loc[missing_med, 'Pre_op_med'] = 'LMWH'
+        self.df['UTI'] = self.df['UTI'].fillna('No')
 
-        print("- Step 24 -Added pre-operative medications")
+        print("- Step 24 -Added patient annotations (pre-operative medications, UTI, VTE timepoints)")
 
-
-    # ----------------------------------------------------------
-    # STEP 17: Process UTI
-    # ----------------------------------------------------------
-    def _Process_UTI(self):
-        self.df['UTI'] = self.df['StudyID'].map(self.comp_uti)
-        self.df['UTI'] = self.df['UTI'].replace({np.nan: 'No'})
-
-        print("- Step 25 -Added UTI complications")
-      
     # ----------------------------------------------------------
     # STEP 18: Process Death/Withdrawals
     # ----------------------------------------------------------
@@ -1067,17 +1529,22 @@ class RedcapProcessor:
             # Normalize text
             comp_death_series = comp_death_series.astype(str).str.strip().str.lower()
 
-            # Mark mortality if 'checked' or 'yes'
-            mortality_ids = self.df.loc[comp_death_series.isin(['checked', 'yes']), 'StudyID'].unique()
-            self.df.loc[self.df['StudyID'].isin(mortality_ids), 'Death'] = 'Yes'
-            self.df.loc[self.df['StudyID'].isin(mortality_ids), 'Withdrawn'] = 'No'
+            # Mark mortality (all rows of the patient) if 'checked' or 'yes'
+            died = comp_death_series.isin(['checked', 'yes']).groupby(self.df['StudyID']).transform('any')
+            self.df.loc[died, 'Death'] = 'Yes'
+            self.df.loc[died, 'Withdrawn'] = 'No'
 
         # ---- Ensure Withdrawn/Death consistent per StudyID ----
-        for study_id, group in self.df.groupby('StudyID'):
-            if (group['Death'] == 'Yes').any():
-                self.df.loc[self.df['StudyID'] == study_id, ['Death', 'Withdrawn']] = ['Yes', 'No']
-            elif (group['Withdrawn'] == 'Yes').any():
-                self.df.loc[self.df['StudyID'] == study_id, 'Withdrawn'] = 'Yes'
+        for col in ['Death', 'Withdrawn']:
+            if col not in self.df.columns:
+                self.df[col] = np.nan
+
+        # Death anywhere overrides Withdrawn; otherwise Withdrawn anywhere marks every row
+        any_death = self.df['Death'].eq('Yes').groupby(self.df['StudyID']).transform('any')
+        any_withdrawn = self.df['Withdrawn'].eq('Yes').groupby(self.df['StudyID']).transform('any')
+
+        self.df.loc[any_death, ['Death', 'Withdrawn']] = ['Yes', 'No']
+        self.df.loc[~any_death & any_withdrawn, 'Withdrawn'] = 'Yes'
 
 
         print("- Step 26 -Flagged patients' death/Withdrawal status")
@@ -1086,45 +1553,20 @@ class RedcapProcessor:
     # STEP 19: Process Treatment
     # ----------------------------------------------------------
     def _process_treatment(self):
-        treatment_map = {
-            # Hip
-            'intra_treatment___1': 'Hemi-arthroplasty (monopolar, bipolar)',
-            'intra_treatment___2': 'Total Hip Arthroplasty',
-            'intra_treatment___3': 'Cannulated Screws',
-            'intra_treatment___4': 'Short cephalomedullary nail',
-            'intra_treatment___5': 'Long cephalomedullary nail',
-            'intra_treatment___6': 'Dynamic Hip Screw',
-            'intra_treatment___7': 'Other',
-
-            # Pathway
-            'intraop_treatment___1': 'Hemi-arthroplasty (monopolar, bipolar)',
-            'intraop_treatment___2': 'Total Hip Arthroplasty',
-            'intraop_treatment___3': 'Cannulated Screws',
-            'intraop_treatment___4': 'Short cephalomedullary nail',
-            'intraop_treatment___5': 'Long cephalomedullary nail',
-            'intraop_treatment___6': 'Dynamic Hip Screw',
-            'intraop_treatment___7': 'Other'
+        # Same options in Hip (intra_treatment) and Pathway (intraop_treatment)
+        treatment_labels = {
+            1: 'Hemi-arthroplasty (monopolar, bipolar)',
+            2: 'Total Hip Arthroplasty',
+            3: 'Cannulated Screws',
+            4: 'Short cephalomedullary nail',
+            5: 'Long cephalomedullary nail',
+            6: 'Dynamic Hip Screw',
+            7: 'Other'
         }
 
-        def process(prefix):
-            # find columns starting with the prefix
-            cols = [c for c in self.df.columns if c.startswith(prefix)]
-            if not cols:
-                return pd.Series([np.nan] * len(self.df), index=self.df.index)
-
-            def mapper(row):
-                checked = [
-                    treatment_map[col]
-                    for col in cols
-                    if str(row.get(col, "")).strip().lower() in ("checked", "1", "true")
-                ]
-                return "/".join(checked) if checked else np.nan
-
-            return self.df.apply(mapper, axis=1)
-
         # Process hip & pathway treatments separately
-        self.df['intra_treatment'] = process('intra_treatment')
-        self.df['intraop_treatment'] = process('intraop_treatment')
+        self.df['intra_treatment'] = decode_checkbox_group(self.df, 'intra_treatment', treatment_labels)
+        self.df['intraop_treatment'] = decode_checkbox_group(self.df, 'intraop_treatment', treatment_labels)
 
         # Preferred: hip → pathway
         self.df['Treatment'] = self.df['intra_treatment'].combine_first(
@@ -1146,32 +1588,18 @@ class RedcapProcessor:
 
     def _process_ethnicity(self):
         if 'bl_ethnicity___1'in self.df.columns:
-            ethnicity_map = {
-                'bl_ethnicity___1': 'Indigenous (e.g. First Nation, Inuit, Metis)',
-                'bl_ethnicity___2': 'White/Caucasian',
-                'bl_ethnicity___3': 'East Asian (e.g. Chinese, Japanese, Korean, Taiwanese)',
-                'bl_ethnicity___4': 'Southeast Asian (e.g. Cambodian, Vietnamese, Hmong, Filipino)',
-                'bl_ethnicity___5': 'Middle Eastern, West Central Asian',
-                'bl_ethnicity___6': 'African',
-                'bl_ethnicity___7': 'Latin, Central, and South American',
-                'bl_ethnicity___8': 'South Asian (e.g. Indian, Pakistani, Nepalese, Sri Lankan)'
+            ethnicity_labels = {
+                1: 'Indigenous (e.g. First Nation, Inuit, Metis)',
+                2: 'White/Caucasian',
+                3: 'East Asian (e.g. Chinese, Japanese, Korean, Taiwanese)',
+                4: 'Southeast Asian (e.g. Cambodian, Vietnamese, Hmong, Filipino)',
+                5: 'Middle Eastern, West Central Asian',
+                6: 'African',
+                7: 'Latin, Central, and South American',
+                8: 'South Asian (e.g. Indian, Pakistani, Nepalese, Sri Lankan)'
             }
 
-            # Find all columns that start with bl_ethnicity___
-            cols = [c for c in self.df.columns if c.startswith('bl_ethnicity___')]
-            if not cols:
-                self.df['Ethnicity'] = np.nan
-                return
-
-            def mapper(row):
-                checked = [
-                    ethnicity_map[col]
-                    for col in cols
-                    if str(row.get(col, "")).strip().lower() in ("checked", "1", "true")
-                ]
-                return "/".join(checked) if checked else np.nan
-
-            self.df['Ethnicity'] = self.df.apply(mapper, axis=1)
+            self.df['Ethnicity'] = decode_checkbox_group(self.df, 'bl_ethnicity', ethnicity_labels)
             print("- Step 28 -Processed Ethnicity")
 
     # ----------------------------------------------------------
@@ -1194,9 +1622,7 @@ class RedcapProcessor:
     # STEP 29: Study Names
     # ----------------------------------------------------------
     def _add_study_names(self):
-
-        self.df['StudyID'] = self.df['StudyID'].astype(str).str.strip()
-
+        # StudyID is already stripped/upper-cased strings (step 11)
         self.df['Study'] = (
             self.df['StudyID']
             .str.extract(r'^(OTT-PATH-|THB-|HPA|TPA|UKA-|TA-|TF|TH)')[0]
@@ -1221,8 +1647,7 @@ class RedcapProcessor:
             self.df['CAS'] = np.nan
 
         if 'cas_timepoint' in self.df.columns:
-                    timepoint_dict_lower = {k.lower(): v for v_list in self.timepoint_dict.values() for k in v_list for v in [list(self.timepoint_dict.keys())[list(self.timepoint_dict.values()).index(v_list)]]}
-                    self.df['cas_timepoint'] = self.df['cas_timepoint'].astype(str).str.lower().map(timepoint_dict_lower)
+                    self.df['cas_timepoint'] = self.aliases.map_timepoints(self.df['cas_timepoint'])
                     # self.df['cas_timepoint']=self.df['cas_timepoint'].apply(self._map_timepoint)
                     self.df['CAS'] = pd.to_numeric(self.df['CAS'], errors='coerce')
                     df_cas = self.df.dropna(subset=['CAS'])[['StudyID','cas_timepoint','CAS']].rename(columns={'cas_timepoint':'Time'})
@@ -1247,21 +1672,8 @@ class RedcapProcessor:
 
 
 
-        # Map VTE times
-        self.df['VTE_time'] = (
-            self.df['StudyID']
-            .map(self.vte_timepoints)
-            .where(lambda x: x.notna())
-        )
-
         
 
-        # Define all timepoints, including NaNs if necessary
-        time_order = {
-            'Admission':1,'Pre_Op':2,'Post_Op':3,'POD1':4,'POD2':5,'POD3':6,'POD4':7,
-            'POD5':8,'POD6':9,'POD7':10,'POD8':11,'POD9':12,'POD10':13,'Week2':14,'Week4':15,'Week6':16, 'Week10':17,'Month3':18, 'Unscheduled': 99
-        }
-
         lst=['R_time', 'K_time','Alpha_Angle', 'MA',
             'LY30', 'ACT','ADP-agg', 'ADP-inh','ADP-ma','AA-agg','AA-inh','AA-ma','CFF-MA','ACTF-MA','CFF-A10','CFF-FLEV']
 
@@ -1273,15 +1685,18 @@ class RedcapProcessor:
         
         
         
-        # Fill missing Time with 'Unknown' to avoid NaNs
-        self.df['Time_filled'] = self.df['Time'].fillna('Unknown')
-
-        # Convert to numeric
-        self.df['Time_num'] = self.df['Time_filled'].map(time_order)
-        self.df['VTE_num']  = self.df['VTE_time'].map(time_order)
+        # Compare positions on the time axis; only after_vte_timepoints take part, so -1 (missing),
+        # values off the axis and the untracked timepoints are never masked
+        tracked = np.append(TIME_AXIS.categories.isin(self.after_vte_timepoints), False)
+        codes = {}
+        for col in ['Time', 'VTE_time']:
+            self.df[col] = as_category(self.df[col], TIME_AXIS.categories, ordered=True)
+            code = self.df[col].cat.codes.to_numpy()
+            codes[col] = np.where((code >= 0) & (code < len(TIME_AXIS.categories)), code, -1)
 
         # Any record AFTER VTE should be blank
-        mask = self.df['Time_num'] > self.df['VTE_num']
+        time_num, vte_num = codes['Time'], codes['VTE_time']
+        mask = tracked[time_num] & tracked[vte_num] & (time_num > vte_num)
 
         
         self.df.loc[mask, lst] = np.nan
@@ -1289,6 +1704,63 @@ class RedcapProcessor:
 
         print("- Step 32 -Removed analysis after VTE event")
 
+    # ----------------------------------------------------------
+    # STEP 33: Lab/TEG dtypes
+    # ----------------------------------------------------------
+    def _coerce_lab_types(self):
+        failed = []
+        unparsed = {}
+        for col, kind in self.lab_schema.items():
+            if col not in self.df.columns:
+                continue
+
+            raw = self.df[col]
+            if kind == 'float' and not pd.api.types.is_float_dtype(raw):
+                typed = pd.to_numeric(raw, errors='coerce').astype(np.float64)
+            elif kind == 'datetime' and not pd.api.types.is_datetime64_dtype(raw):
+                typed = parse_redcap_datetimes(raw)
+            else:
+                continue
+
+            # Values present before but missing after the coercion did not parse
+            lost = raw.notna() & typed.isna()
+            bad = raw[lost].astype(str).value_counts()
+            if len(bad):
+                failed.append(pd.DataFrame({'column': col, 'value': bad.index, 'count': bad.to_numpy()}))
+                unparsed[col] = lost
+            self.df[col] = typed
+
+        self.coercion_report = (pd.concat(failed, ignore_index=True) if failed
+                                else pd.DataFrame(columns=['column', 'value', 'count']))
+        # The draw store still counts these cells as recorded when deciding which draws to keep
+        self.unparsed = pd.DataFrame(unparsed, index=self.df.index)
+        print(f"- Step 33 -Coerced lab/TEG columns ({int(self.coercion_report['count'].sum())} values did not parse)")
+
+    # ----------------------------------------------------------
+    # STEP 34: Categorical dtypes
+    # ----------------------------------------------------------
+    def _apply_categories(self):
+        self.df = self._categorize(self.df)
+        print("- Step 34 -Stored IDs, study, Yes/No flags and Time as categoricals")
+
+    def _categorize(self, frame):
+        """
+        Cast the categorical_cols and Time (ordered) of a frame. Output tables reuse the
+        categories of self.df where it already has them, so they combine/merge cleanly.
+        """
+        specs = {col: (categories, False) for col, categories in self.categorical_cols.items()}
+        specs.update(dict.fromkeys(['Time', 'VTE_time'], (list(TIME_AXIS.categories), True)))
+
+        for col, (categories, ordered) in specs.items():
+            if col not in frame.columns:
+                continue
+            known = (self.df[col].dtype if self.df is not None and frame is not self.df and col in self.df.columns
+                     else None)
+            if isinstance(known, pd.CategoricalDtype):
+                categories = list(known.categories)
+            frame[col] = as_category(frame[col], categories, ordered)
+        return frame
+
         
     
 
@@ -1301,53 +1773,30 @@ class RedcapProcessor:
     def _build_records(self):
         """
         Build Record objects (not DataFrames).
+        Demographics of all patients are one frame (self.demographics, first non-null value
+        per patient and column); blood draws live in one columnar DrawStore (self.draw_store).
+        Each Record and BloodDraw is a view into them.
         Later, you can convert them to DataFrames with record.to_dataframe().
         """
-        self.records = {}
-
-        for study_id, rows in self.df.groupby("StudyID"):
-
-            # EXTRACT DEMOGRAPHICS
-
-            demo = {}
-            for col in self.demographic_cols:
-                if col in rows.columns:
-                    values = rows[col].dropna()
-                    demo[col] = values.iloc[0] if len(values) > 0 else None
-
-            # BUILD BLOOD DRAW OBJECTS
-
-            blood_draws = []
+        self.draw_store = DrawStore.from_frame(self.df, self.lab_cols, self.lab_schema, unparsed=self.unparsed)
 
-            for _, row in rows.iterrows():
-                labs = {col: row[col] for col in self.lab_cols if col in row.index}
+        # EXTRACT DEMOGRAPHICS (first value per patient; StudyID stays a column, in demographic_cols order)
+        cols = [c for c in self.demographic_cols if c in self.df.columns]
+        demo, ids = first_non_null(self.df[cols], self.df['StudyID'])
+        self.demographics = self._categorize(demo)
 
-                # skip rows where all labs are NA
-                if not any(pd.notna(v) for v in labs.values()):
-                    continue
-
-                # draw_id = row.get("Draw_ID", None)
-                draw_id = "_".join(
-                    str(row.get(col, "")) 
-                    for col in ["redcap_event_name", "redcap_repeat_instrument", "redcap_repeat_instance"]
-                ).strip("_")
-
-                blood_draws.append(BloodDraw(draw_id=draw_id, **labs))
-
-
-            # CREATE RECORD OBJECT
-
-            record = Record(
+        # CREATE RECORD OBJECTS (views into the demographics frame and the draw store)
+        self.records = {
+            study_id: Record(
                 record_id=study_id,
-                demographics=demo,
-                blood_draws=blood_draws,
+                demographics=DemographicsRow(self.demographics, pos),
+                store=self.draw_store,
             )
+            for pos, study_id in enumerate(ids)
+        }
 
-            # compute time differences inside the record
-            record.add_time_differences()
-            
-
-            self.records[study_id] = record
+        # time differences for all records at once
+        self._add_time_differences()
 
         print("Records Successfully Built!")
         print('************************************************************************************')
@@ -1355,26 +1804,80 @@ class RedcapProcessor:
 
 
     ##### HELPER METHODS #####
+    @property
+    def df(self):
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        self._df = value
+        self._data_version += 1
+
+    @property
+    def records(self):
+        return self._records
+
+    @records.setter
+    def records(self, value):
+        self._records = value
+        self._data_version += 1
+
+    def invalidate_cache(self):
+        """
+        Drop the cached output tables. Needed after any in-place edit the cache cannot see:
+        self.df.loc[...] = ..., record.demographics[...] = ..., draw store columns, etc.
+        """
+        self._table_cache = {}
+
+    def _table(self, name):
+        """
+        (frame, PatientIndex) of one output table, built once per data version:
+        'df' (processed frame), 'demographics', 'lab' or 'teg'.
+        The version only changes when self.df/self.records are reassigned or records are
+        added/removed; in-place edits keep serving the old tables until invalidate_cache().
+        """
+        key = (self._data_version, len(self.records))
+        if self._table_cache.get('key') != key:
+            self._table_cache = {'key': key}
+
+        if name not in self._table_cache:
+            if name in ('lab', 'teg'):
+                lab, teg = self._build_all_labs()
+                self._table_cache['lab'] = (lab, PatientIndex(lab))
+                self._table_cache['teg'] = (teg, PatientIndex(teg))
+            elif name == 'demographics':
+                self._table_cache[name] = (self.demographics, PatientIndex(self.demographics))
+            elif name == 'df':
+                self._table_cache[name] = (self.df, PatientIndex(self.df))
+            else:
+                raise KeyError(name)
+        return self._table_cache[name]
+
     ### ALL PATIENTS
     def get_all_demographics(self):
-        rows = []
-        for sid, rec in self.records.items():
-            row = rec.demographics.copy()
-            row["StudyID"] = sid
-            rows.append(row)
-        return pd.DataFrame(rows)
+        """
+        Demographics of all patients (one row per patient), as a copy: self.demographics
+        backs every record's DemographicsRow and the lookup tables, so edits there are shared.
+        """
+        return self.demographics.copy()
 
 
     def get_all_labs(self):
+        """
+        (lab, teg) tables of all patients; served from a cache, callers get copies.
+        After editing self.df or a record in place, call invalidate_cache() first.
+        """
+        lab, _ = self._table('lab')
+        teg, _ = self._table('teg')
+        return lab.copy(), teg.copy()
 
-        # --- Gather all row dataframes ---
-        dfs = [rec.to_lab_dataframe() for rec in self.records.values()]
-        dfs = [df for df in dfs if not df.empty]
+    def _build_all_labs(self):
 
-        if not dfs:
-            return pd.DataFrame(), pd.DataFrame()
+        # --- All draws in one slice of the draw store ---
+        out = self._lab_table()
 
-        out = pd.concat(dfs, ignore_index=True)
+        if out.empty:
+            return pd.DataFrame(), pd.DataFrame()
 
         # --- Define column groups ---
         teg_cols = [
@@ -1400,9 +1903,11 @@ class RedcapProcessor:
             out["draw_group"] = None
 
         # ---------------------- TEG   ROWS -------------------------------
+        # Presence from the draw store (rows of out): unparsable values still count as recorded
+        store = self.draw_store
         cas_cols = [c for c in out.columns if c.startswith("CAS")]
-        has_teg = out[['R_time','K_time','Alpha_Angle','MA','LY30','ACT','ADP-agg','ADP-inh','ADP-ma','AA-agg','AA-inh','AA-ma','CFF-MA','ACTF-MA','CFF-A10','CFF-FLEV']].notna().any(axis=1)
-        has_cas = out[cas_cols].notna().any(axis=1)
+        has_teg = store.has_value(['R_time','K_time','Alpha_Angle','MA','LY30','ACT','ADP-agg','ADP-inh','ADP-ma','AA-agg','AA-inh','AA-ma','CFF-MA','ACTF-MA','CFF-A10','CFF-FLEV'])
+        has_cas = store.has_value(cas_cols)
         keep_teg = has_teg | has_cas
         teg_rows = out[keep_teg].copy()
         cols_to_keep_teg = ['StudyID','Draw_ID'] + teg_cols + cas_cols
@@ -1411,7 +1916,7 @@ class RedcapProcessor:
 
         # ---------------------- LAB   ROWS -------------------------------
         # Rows where BOTH Hgb and Cr are missing
-        both_missing = out[['Hemoglobin', 'Creatinine','CAS']].isna().all(axis=1)
+        both_missing = ~store.has_value(['Hemoglobin', 'Creatinine','CAS'])
 
         # Rows with blood_rbc equal to zero
         rbc_zero = out['blood_rbc'] == 0
@@ -1476,26 +1981,54 @@ class RedcapProcessor:
         lab_rows= lab_rows.drop(columns=['draw_group'])
          
         # Again- because draw_group needed to be standardized too
-        lab_rows['Time'] = lab_rows['Time'].replace({'Pre-Operative':'Pre_Op',
-                                                     'Pre-Operative (Arm 1: Arm 1)':'Pre_Op',
-                                                     'Post-Operative                ':'Post_Op',
-                                                     'Post-Operative':'Post_Op',
-                                                     'Post-Operative (Arm 1: Arm 1)':'Post_Op',
-                                                     '1-hour Post-Op (Arm 1: Arm 1)':'Post_Op',
-                                                     'POD 1 (Arm 1: Arm 1)':'POD1',
-                                                     'POD 2 (Arm 1: Arm 1)':'POD2',
-                                                     'POD 3 (Arm 1: Arm 1)':'POD3',
-                                                     'Patient Admission':'Admission',
-                                                     'Intra-Operative':'Intra_Op',
-                                                     'Intra-Opertative':'Intra_Op',
-                                                     'Intra-Operative (Arm 1: Arm 1)':'Intra_Op',
-                                                     'Unscheduled Follow Up ':'Unscheduled',
-                                                     'Unscheduled Follow-up':'Unscheduled',
-                                                     'Unscheduled (Arm 1: Arm 1)':'Unscheduled',
-                                                     '12 Week Follow Up (Arm 1: Arm 1)':'Month3',
-                                                     })
+        lab_rows['Time'] = self.aliases.relabel_events(lab_rows['Time'])
         
-        return lab_rows, teg_rows
+        return self._categorize(lab_rows), self._categorize(teg_rows)
+
+
+    def _add_time_differences(self):
+        """
+        Vectorized Record.add_time_differences + add_draw_time_differences over all records:
+        injury->surgery hours become a column of self.demographics, the per-draw hours are
+        stored as columns of the draw store (to_lab_dataframe then only slices them).
+        """
+        demo = self.demographics
+        ids = list(self.records)
+        dates = pd.DataFrame({
+            col: (parse_redcap_datetimes(demo[col]).to_numpy() if col in demo.columns
+                  else np.full(len(demo), np.datetime64('NaT'), dtype='datetime64[ns]'))
+            for col in ['Injury_date', 'Surgery_date']
+        }, index=ids)
+
+        hours = (dates['Surgery_date'] - dates['Injury_date']) / pd.Timedelta(hours=1)
+        demo['time_injury_to_surgery_hours'] = hours.to_numpy()
+
+        # per draw: injury/surgery date of the draw's patient
+        store = self.draw_store
+        per_draw = dates.reindex(store.patient_ids).iloc[store.patient_rows].reset_index(drop=True)
+        draws = pd.DataFrame({c: store.column(c) for c in ['Draw_date_lab', 'blood_date', 'Draw_date_teg']
+                              if c in store.columns}, index=per_draw.index)
+        draws = add_draw_time_differences(draws, per_draw['Injury_date'], per_draw['Surgery_date'])
+        for col in DRAW_DURATION_COLS:
+            store.add_column(col, draws[col].to_numpy(dtype=np.float64))
+
+    def _lab_table(self):
+        """Every record's to_lab_dataframe() rows, built from the draw store in one go."""
+        out = self.draw_store.to_frame()
+        if out.empty:
+            return out
+
+        def per_draw(col):
+            demo = self.demographics
+            values = demo[col] if col in demo.columns else pd.Series(None, index=demo.index, dtype=object)
+            return out['StudyID'].map(dict(zip(demo['StudyID'], values)))
+
+        if 'VTE_time' not in out.columns:
+            out.insert(2, 'VTE_time', per_draw('VTE_time'))
+        if all(c in out.columns for c in DRAW_DURATION_COLS):
+            return out
+
+        return add_draw_time_differences(out, per_draw('Injury_date'), per_draw('Surgery_date'))
 
 
     def get_full_dataframe(self):
@@ -1518,29 +2051,44 @@ class RedcapProcessor:
 
     def get_draws(self, StudyID):
         """
-        Return all blood-draw rows for a single patient by filtering the
-        DataFrame returned by self.get_all_labs().
-        The returned DataFrame is a copy (read-only for callers).
+        Return the (lab, teg) rows of a single patient, sorted by Time.
+        Looked up in the cached get_all_labs() tables; the returned DataFrames are copies.
         """
-        # Get the combined table you already wrote
-        all_labs = self.get_all_labs()
-        if all_labs.empty:
+        def rows(name):
+            patient_df = self._lookup(name, [StudyID])
+            if "Time" in patient_df.columns:
+                patient_df = patient_df.sort_values(by=["Time"])
+            return patient_df.reset_index(drop=True)
+
+        return rows('lab'), rows('teg')
+
+    def _lookup(self, name, study_ids):
+        """Rows of the given patients (in the given order) from one cached output table."""
+        frame, index = self._table(name)
+        positions = index.positions(study_ids)
+        if len(positions) == 0:
             return pd.DataFrame()
+        return frame.iloc[positions]
 
-        # Filter by StudyID and return a copy
-        patient_df = all_labs[all_labs.get("StudyID") == StudyID].copy()
-
-        # If you'd rather return an empty DataFrame when not found:
-        if patient_df.empty:
-            return pd.DataFrame()
-
-        # Optional: reset index and sort by Time if present
-        if "Time" in patient_df.columns:
-            patient_df = patient_df.sort_values(by=["Time"]).reset_index(drop=True)
-        else:
-            patient_df = patient_df.reset_index(drop=True)
-
-        return patient_df
+    def patient(self, StudyID):
+        """
+        (demographics, lab, teg) DataFrames of one patient, via the StudyID indexes.
+        Read from the cached tables: stale after in-place edits until invalidate_cache().
+        """
+        return self.patients([StudyID])
+
+    def patients(self, StudyIDs):
+        """(demographics, lab, teg) DataFrames of one StudyID or a list of them, rows grouped in the order given."""
+        if isinstance(StudyIDs, str):
+            StudyIDs = [StudyIDs]
+        return tuple(self._lookup(name, list(StudyIDs)).reset_index(drop=True)
+                     for name in ('demographics', 'lab', 'teg'))
+
+    def patient_rows(self, StudyIDs):
+        """Rows of the processed self.df for one StudyID or a list of them."""
+        if isinstance(StudyIDs, str):
+            StudyIDs = [StudyIDs]
+        return self._lookup('df', list(StudyIDs)).copy()
     
 
     
@@ -1549,28 +2097,292 @@ class RedcapProcessor:
 # BloodDraw and Record classes
 # -----------------------
 
+# int64 value of NaT in datetime64[ns] arrays
+NAT_INT = np.iinfo(np.int64).min
+
+# Columns added by add_draw_time_differences, in order
+DRAW_DURATION_COLS = ["time_injury_lab_hours", "time_surgery_lab_hours", "time_injury_rbc_hours",
+                      "time_injury_teg_hours", "time_surgery_teg_hours"]
+
+
+def add_draw_time_differences(df, injury_date, surgery_date):
+    """
+    Add hours from injury/surgery to each lab, RBC and TEG draw.
+    injury_date/surgery_date: a scalar for one patient, or a Series aligned with df.
+    """
+    def to_datetime(value):
+        if value is None:
+            return None
+        return parse_redcap_datetimes(value)
+
+    def hours_since(col, reference):
+        if reference is None or col not in df.columns:
+            return np.nan
+        return (parse_redcap_datetimes(df[col]) - reference) / pd.Timedelta(hours=1)
+
+    injury_date, surgery_date = to_datetime(injury_date), to_datetime(surgery_date)
+
+    # Lab
+    df["time_injury_lab_hours"] = hours_since("Draw_date_lab", injury_date)
+    df["time_surgery_lab_hours"] = hours_since("Draw_date_lab", surgery_date)
+    df["time_injury_rbc_hours"] = hours_since("blood_date", injury_date)
+
+    # TEG
+    df["time_injury_teg_hours"] = hours_since("Draw_date_teg", injury_date)
+    df["time_surgery_teg_hours"] = hours_since("Draw_date_teg", surgery_date)
+
+    return df
+
+
+class PatientIndex:
+    """
+    StudyID index over a frame: patients sorted (categorical codes) with an offset table.
+    Rows of ids[i] are order[offsets[i]:offsets[i + 1]] (positions in the frame, original order).
+    """
+
+    def __init__(self, frame, id_col='StudyID'):
+        if frame is None or id_col not in frame.columns:
+            codes, ids = np.array([], dtype=np.intp), pd.Index([])
+        else:
+            codes, ids = pd.factorize(frame[id_col], sort=True)
+
+        # rows without a StudyID (code -1) are not indexed
+        order = np.argsort(codes, kind='stable')
+        self.order = order[codes[order] >= 0]
+        self.ids = pd.Index(ids)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(ids)))])
+
+    def __contains__(self, study_id):
+        return study_id in self.ids
+
+    def positions(self, study_ids):
+        """Frame positions of the rows of study_ids, grouped in the order given (unknown IDs skipped)."""
+        pos = self.ids.get_indexer(study_ids)
+        pos = pos[pos >= 0]
+        if len(pos) == 0:
+            return np.array([], dtype=np.intp)
+        return np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in pos])
+
+
+class DrawStore:
+    """
+    Blood draws of all patients as contiguous per-column arrays.
+
+    Draws are grouped by patient (sorted StudyID, original row order within a patient);
+    the draws of patient_ids[i] are rows offsets[i]:offsets[i + 1].
+    Columns typed 'float' in the lab schema are float64 arrays, 'datetime' columns are
+    int64 nanoseconds (NaT = iNaT); everything else is an object array.
+    Values that were recorded but did not parse are missing in the arrays and flagged in
+    `unparsed`, so has_value() still counts them as present.
+    """
+
+    # Fields that make up a draw's Draw_ID
+    DRAW_ID_COLS = ["redcap_event_name", "redcap_repeat_instrument", "redcap_repeat_instance"]
+
+    def __init__(self, columns, draw_ids, study_ids, patient_ids, offsets, datetime_cols=(), unparsed=None):
+        self.columns = columns          # lab column -> np.ndarray (one entry per draw)
+        self.datetime_cols = set(datetime_cols)
+        self.unparsed = unparsed or {}  # lab column -> bool array, True where a value did not parse
+        self.draw_ids = draw_ids
+        self.study_ids = study_ids      # StudyID of every draw
+        self.patient_ids = patient_ids
+        self.offsets = offsets
+        self.positions = {sid: i for i, sid in enumerate(patient_ids)}
+
+    @classmethod
+    def from_frame(cls, df, lab_cols, schema=None, id_col='StudyID', unparsed=None):
+        """
+        unparsed: optional boolean frame (df's index, some of lab_cols) of cells whose
+        recorded value was coerced to NaN/NaT before; they count as present.
+        """
+        lab_cols = [c for c in lab_cols if c in df.columns]
+        schema = schema or {}
+        unparsed = pd.DataFrame(index=df.index) if unparsed is None else unparsed
+        unparsed = unparsed.reindex(columns=lab_cols, fill_value=False)
+        if not unparsed.index.equals(df.index):
+            unparsed = unparsed.reindex(df.index, fill_value=False)
+        unparsed = unparsed.fillna(False).astype(bool)
+
+        # Patients in groupby order; rows without a StudyID are not part of any record
+        codes, patient_ids = pd.factorize(df[id_col], sort=True)
+
+        # skip rows where all labs are NA (and none was recorded but unparsable)
+        present = df[lab_cols].notna().to_numpy() | unparsed.to_numpy()
+        keep = present.any(axis=1) & (codes >= 0)
+        order = np.flatnonzero(keep)[np.argsort(codes[keep], kind='stable')]
+
+        def take(col):
+            # Column by column, so every stored array is compact (no view into a wide block)
+            return df[col].iloc[order]
+
+        counts = np.bincount(codes[order], minlength=len(patient_ids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        # Draw_ID = event_instrument_instance
+        parts = [take(c).astype(str).to_numpy(dtype=object) if c in df.columns else np.full(len(order), '', dtype=object)
+                 for c in cls.DRAW_ID_COLS]
+        draw_ids = pd.Series(parts[0] + '_' + parts[1] + '_' + parts[2], dtype=object).str.strip('_').to_numpy(dtype=object)
+
+        study_ids = np.asarray(patient_ids, dtype=object)[codes[order]]
+
+        columns, flagged = {}, {}
+        for c in lab_cols:
+            kind = schema.get(c)
+            raw = take(c)
+            if kind == 'float':
+                typed = pd.to_numeric(raw, errors='coerce')
+                columns[c] = typed.to_numpy(dtype=np.float64)
+            elif kind == 'datetime':
+                typed = parse_redcap_datetimes(raw)
+                columns[c] = typed.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            else:
+                columns[c] = raw.to_numpy(dtype=object)
+                continue
+            # unparsable before (unparsed) or here
+            lost = unparsed[c].to_numpy()[order] | (raw.notna() & typed.isna()).to_numpy()
+            if lost.any():
+                flagged[c] = lost
+
+        datetime_cols = [c for c in lab_cols if schema.get(c) == 'datetime']
+        return cls(columns, draw_ids, study_ids, list(patient_ids), offsets, datetime_cols, flagged)
+
+    @property
+    def patient_rows(self):
+        """For every draw, the position of its patient in patient_ids."""
+        return np.repeat(np.arange(len(self.patient_ids)), np.diff(self.offsets))
+
+    def add_column(self, col, values):
+        """Store a derived per-draw column (appended after the lab columns)."""
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.datetime64):
+            self.datetime_cols.add(col)
+            values = values.astype('datetime64[ns]').view(np.int64)
+        self.columns[col] = values
+
+    def has_value(self, cols):
+        """For every draw, whether any of cols holds a value, parsed or not (unknown cols: none)."""
+        present = np.zeros(len(self.draw_ids), dtype=bool)
+        for col in cols:
+            if col not in self.columns:
+                continue
+            values = self.columns[col]
+            present |= (values != NAT_INT) if col in self.datetime_cols else pd.notna(values)
+            if col in self.unparsed:
+                present |= self.unparsed[col]
+        return present
+
+    def value(self, col, row):
+        """One stored value, with datetime columns returned as pd.Timestamp / NaT."""
+        value = self.columns[col][row]
+        if col in self.datetime_cols:
+            return pd.Timestamp(value) if value != NAT_INT else pd.NaT
+        return value
+
+    def column(self, col, start=0, stop=None):
+        """A slice of a column; datetime columns as a zero-copy datetime64[ns] view."""
+        values = self.columns[col][start:stop]
+        if col in self.datetime_cols:
+            return values.view('datetime64[ns]')
+        return values
+
+    def span(self, study_id):
+        """(start, stop) rows of one patient; (0, 0) if unknown."""
+        pos = self.positions.get(study_id)
+        if pos is None:
+            return 0, 0
+        return self.offsets[pos], self.offsets[pos + 1]
+
+    def to_frame(self, start=0, stop=None):
+        """Rows start:stop as a DataFrame: StudyID, Draw_ID, then the lab columns."""
+        stop = len(self.draw_ids) if stop is None else stop
+        data = {'StudyID': self.study_ids[start:stop], 'Draw_ID': self.draw_ids[start:stop]}
+        if 'VTE_time' in self.columns:
+            data['VTE_time'] = self.column('VTE_time', start, stop)
+        for c in self.columns:
+            data[c] = self.column(c, start, stop)   # StudyID/VTE_time keep their leading position
+        return pd.DataFrame(data)
+
+
 class BloodDraw:
-    def __init__(self, draw_id=None, **labs):
-        self.draw_id = draw_id
+    """View of one draw in a DrawStore; lab values are attributes (draw.Hemoglobin)."""
 
-        # store all lab values dynamically
-        for k, v in labs.items():
-            setattr(self, k, v)
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def draw_id(self):
+        return self._store.draw_ids[self._row]
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails, i.e. for lab columns
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._store.columns:
+            raise AttributeError(name)
+        return self._store.value(name, self._row)
+
+    def to_dict(self):
+        return {c: self._store.value(c, self._row) for c in self._store.columns}
+
+
+class DemographicsRow(Mapping):
+    """
+    Dict-like view of one patient's row in the demographics frame.
+    Missing values read as None (like the per-record dicts this replaces); setting a key
+    writes into the frame, adding the column if needed.
+    """
+
+    __slots__ = ('_frame', '_pos')
+
+    def __init__(self, frame, pos):
+        self._frame = frame
+        self._pos = pos
+
+    def __getitem__(self, key):
+        if key not in self._frame.columns:
+            raise KeyError(key)
+        value = self._frame.iat[self._pos, self._frame.columns.get_loc(key)]
+        return None if np.ndim(value) == 0 and pd.isna(value) else value
+
+    def __setitem__(self, key, value):
+        if key not in self._frame.columns:
+            self._frame[key] = None
+        self._frame.iat[self._pos, self._frame.columns.get_loc(key)] = value
+
+    def __iter__(self):
+        return iter(self._frame.columns)
+
+    def __len__(self):
+        return len(self._frame.columns)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"DemographicsRow({self.copy()!r})"
 
 
 class Record:
-    def __init__(self, record_id, demographics, blood_draws):
+    def __init__(self, record_id, demographics, store):
         self.record_id = record_id
         self.demographics = demographics
-        self.blood_draws = blood_draws
+        self.store = store
+
+    @property
+    def blood_draws(self):
+        start, stop = self.store.span(self.record_id)
+        return [BloodDraw(self.store, row) for row in range(start, stop)]
 
     def add_time_differences(self):
         injury = self.demographics.get('Injury_date')
         surgery = self.demographics.get('Surgery_date')
 
         if injury is not None and surgery is not None:
-            injury_dt = pd.to_datetime(injury, errors='coerce')
-            surgery_dt = pd.to_datetime(surgery, errors='coerce')
+            injury_dt = parse_redcap_datetimes(injury)
+            surgery_dt = parse_redcap_datetimes(surgery)
             if pd.notna(injury_dt) and pd.notna(surgery_dt):
                 self.demographics['time_injury_to_surgery_hours'] = (surgery_dt - injury_dt).total_seconds() / 3600
             else:
@@ -1589,8 +2401,9 @@ class Record:
     # ⭐ Return demographics as a DataFrame
     # ---------------------------------------------------
     def to_demographics_dataframe(self):
-        df = pd.DataFrame([self.demographics])
-        df.insert(0, "StudyID", self.record_id)
+        df = pd.DataFrame([self.demographics.copy()])
+        if "StudyID" not in df.columns:
+            df.insert(0, "StudyID", self.record_id)
         return df
 
     # ---------------------------------------------------
@@ -1598,103 +2411,131 @@ class Record:
     # ---------------------------------------------------
     def to_lab_dataframe(self):
         """Each blood draw = one row; includes time from injury to lab/TEG."""
-        if len(self.blood_draws) == 0:
+        start, stop = self.store.span(self.record_id)
+        if start == stop:
             return pd.DataFrame()
 
-        # get injury date from demographics
-        injury_date = self.demographics.get("Injury_date")
-        if injury_date is not None:
-            # ensure it is a pandas datetime
-            injury_date = pd.to_datetime(injury_date)
+        df = self.store.to_frame(start, stop)
+        if 'VTE_time' not in df.columns:
+            df.insert(2, 'VTE_time', self.demographics.get("VTE_time"))
+        if all(c in df.columns for c in DRAW_DURATION_COLS):
+            return df   # already computed for all draws by RedcapProcessor._add_time_differences
 
-        # get surgery date from demographics # ADDED DEC11
+        # injury/surgery date from demographics
+        injury_date = self.demographics.get("Injury_date")
         surgery_date = self.demographics.get("Surgery_date")
-        if surgery_date is not None:
-            # ensure it is a pandas datetime
-            surgery_date = pd.to_datetime(surgery_date)
+        return add_draw_time_differences(df, injury_date, surgery_date)
 
 
-        vte_time = self.demographics.get("VTE_time")
-        
+    # ---------------------------------------------------
+    # ⭐ Full flattened DF = demographics + labs
+    # ---------------------------------------------------
+    def to_dataframe(self):
+        df_labs = self.to_lab_dataframe()
+        if df_labs.empty:
+            return pd.DataFrame()
 
-        rows = []
-        for draw in self.blood_draws:
-            # Build Draw_ID (you can also include redcap_event_name etc.)
-            draw_id = getattr(draw, "draw_id", None) or "_".join(
-                str(draw.__dict__.get(col, "")) 
-                for col in ["redcap_event_name", "redcap_repeat_instrument", "redcap_repeat_instance"]
-            ).strip("_")
+        for col, val in self.demographics.items():
+            df_labs[col] = val
 
-            row = {"StudyID": self.record_id, "Draw_ID": draw_id, "VTE_time": vte_time}
-            
-       
+        return df_labs
 
-            # Copy all lab fields
-            for k, v in draw.__dict__.items():
-                if k not in ["draw_id", "redcap_event_name", "redcap_repeat_instrument", "redcap_repeat_instance"]:
-                    row[k] = v
-
-            # Compute time differences if possible
-            # Lab
-            draw_date_lab = getattr(draw, "Draw_date_lab", None)
-            if injury_date is not None and draw_date_lab is not None:
-                draw_date_lab = pd.to_datetime(draw_date_lab)
-                row["time_injury_lab_hours"] = (draw_date_lab - injury_date).total_seconds() / 3600
-            else:
-                row["time_injury_lab_hours"] = None
 
-          
-            if surgery_date is not None and draw_date_lab is not None: ###### ADDED DEC11
-                draw_date_lab = pd.to_datetime(draw_date_lab)
-                row["time_surgery_lab_hours"] = (draw_date_lab - surgery_date).total_seconds() / 3600
-            else:
-                row["time_surgery_lab_hours"] = None
 
+# -----------------------
+# Several studies at once
+# -----------------------
 
-            blood_date = getattr(draw, "blood_date", None) ###### ADDED DEC23
+def _process_study(processor):
+    """
+    Worker for StudyCollection: run the pipeline of a fetched processor (pickled without its
+    API connection) in a child process and return it with its records and cached tables.
+    """
+    processor.process()
+    processor.get_all_labs()
+    return processor
+
+
+class StudyCollection:
+    """
+    Fetch and process several REDCap projects in one go.
+
+    studies: dict of study name -> (api_url, api_key), e.g. {'Hip': (url, key_hip), ...}
+    Fetches run concurrently on threads; the processing pipelines run in a process pool, and
+    each processor in self.processors receives its processed frame, records and tables back,
+    so per-study lookups (processors[name].get_all_labs(), .patient(...)) work afterwards.
+    Extra keyword arguments are passed to every RedcapProcessor.
+    """
+
+    datetime_cols = ['Injury_date', 'Admission_date', 'Surgery_date', 'Draw_date_lab', 'Draw_date_teg', 'blood_date']
+
+    def __init__(self, studies, max_fetch_workers=None, max_process_workers=None, **processor_kwargs):
+        self.studies = dict(studies)
+        self.max_fetch_workers = max_fetch_workers or len(self.studies)
+        self.max_process_workers = max_process_workers or min(len(self.studies), os.cpu_count() or 1)
+        self.processor_kwargs = processor_kwargs
+
+        self.processors = {
+            name: RedcapProcessor(api_url, api_key, **processor_kwargs)
+            for name, (api_url, api_key) in self.studies.items()
+        }
 
-            if injury_date is not None and blood_date is not None:
-                blood_date_dt = pd.to_datetime(blood_date, errors="coerce")
-                if pd.notna(blood_date_dt):
-                    row["time_injury_rbc_hours"] = (
-                        blood_date_dt - injury_date
-                    ).total_seconds() / 3600
-                else:
-                    row["time_injury_rbc_hours"] = None
-            else:
-                row["time_injury_rbc_hours"] = None
-            
+        self.frames = {}  # study name -> (demographics, lab, teg)
+        self.demographics = pd.DataFrame()
+        self.labs = pd.DataFrame()
+        self.tegs = pd.DataFrame()
 
-            
-            # TEG
-            draw_date_teg = getattr(draw, "Draw_date_teg", None)
-            if injury_date is not None and draw_date_teg is not None:
-                draw_date_teg = pd.to_datetime(draw_date_teg)
-                row["time_injury_teg_hours"] = (draw_date_teg - injury_date).total_seconds() / 3600
-            else:
-                row["time_injury_teg_hours"] = None
+    def fetch_and_process(self, refresh=False):
+        """Returns the combined (demographics, lab, teg) frames of all studies."""
 
-            if surgery_date is not None and draw_date_teg is not None: ###### ADDED DEC11
-                draw_date_lab = pd.to_datetime(draw_date_teg)
-                row["time_surgery_teg_hours"] = (draw_date_teg - surgery_date).total_seconds() / 3600
-            else:
-                row["time_surgery_teg_hours"] = None
+        # ---- Fetch (network bound) ----
+        with ThreadPoolExecutor(max_workers=self.max_fetch_workers) as pool:
+            list(pool.map(lambda processor: processor._fetch_records(refresh=refresh), self.processors.values()))
 
-            rows.append(row)
+        # ---- Process (CPU bound) ----
+        with ProcessPoolExecutor(max_workers=self.max_process_workers) as pool:
+            futures = {name: pool.submit(_process_study, p) for name, p in self.processors.items()}
+            for name, future in futures.items():
+                processor = self.processors[name]
+                project = processor.project
+                processor.__dict__.update(future.result().__dict__)
+                processor.project = project
 
-        return pd.DataFrame(rows)
+        self.frames = {name: (p.get_all_demographics(), *p.get_all_labs()) for name, p in self.processors.items()}
 
+        self.demographics = self._combine({name: f[0] for name, f in self.frames.items()})
+        self.labs = self._combine({name: f[1] for name, f in self.frames.items()})
+        self.tegs = self._combine({name: f[2] for name, f in self.frames.items()})
 
-    # ---------------------------------------------------
-    # ⭐ Full flattened DF = demographics + labs
-    # ---------------------------------------------------
-    def to_dataframe(self):
-        df_labs = self.to_lab_dataframe()
-        if df_labs.empty:
-            return pd.DataFrame()
+        return self.demographics, self.labs, self.tegs
 
-        for col, val in self.demographics.items():
-            df_labs[col] = val
+    def _combine(self, frames):
+        """Concatenate the per-study frames once, with a Study column and consistent dtypes."""
+        frames = {name: df for name, df in frames.items() if not df.empty}
+        if not frames:
+            return pd.DataFrame()
 
-        return df_labs
+        out = pd.concat(
+            [df.assign(Study=df['Study'].astype(object).fillna(name) if 'Study' in df.columns else name)
+             for name, df in frames.items()],
+            ignore_index=True
+        )
 
+        # Categoricals with different categories per study come out of concat as object;
+        # cast back with the union of the categories (first-seen order, e.g. Time stays chronological)
+        for col in out.columns:
+            dtypes = [df[col].dtype for df in frames.values() if col in df.columns]
+            if col == 'Study' or any(isinstance(t, pd.CategoricalDtype) for t in dtypes):
+                cats = [t.categories for t in dtypes if isinstance(t, pd.CategoricalDtype)]
+                categories = list(dict.fromkeys(c for cat in cats for c in cat))
+                ordered = any(t.ordered for t in dtypes if isinstance(t, pd.CategoricalDtype))
+                out[col] = as_category(out[col].astype(object), categories, ordered)
+
+        # A column can be parsed in one study and still raw (or all-missing) in another
+        for col in out.columns:
+            if col in self.datetime_cols:
+                out[col] = parse_redcap_datetimes(out[col])
+            elif col.endswith('_hours'):
+                out[col] = pd.to_numeric(out[col], errors='coerce')
+
+        return out
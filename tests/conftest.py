@@ -0,0 +1,10 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to the notebook
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The pipeline module imports PyCap at import time
+pytest.importorskip('redcap')
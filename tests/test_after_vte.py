@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from redcap_classes_V2 import RedcapProcessor
+
+TEG = ['R_time', 'K_time', 'Alpha_Angle', 'MA', 'LY30', 'ACT', 'ADP-agg', 'ADP-inh', 'ADP-ma',
+       'AA-agg', 'AA-inh', 'AA-ma', 'CFF-MA', 'ACTF-MA', 'CFF-A10', 'CFF-FLEV']
+
+
+def blanked(times, vte_time):
+    processor = RedcapProcessor('https://redcap.example/api/', 'TOKEN', project=object())
+    processor.df = pd.DataFrame({'Time': times, 'VTE_time': vte_time, **{col: 1.0 for col in TEG}})
+    processor._remove_data_after_vte()
+    return processor.df['MA'].isna().tolist()
+
+
+@pytest.mark.parametrize('vte_time, time, expected', [
+    ('POD1', 'POD2', True),
+    ('POD1', 'POD1', False),
+    ('POD1', 'Pre_Op', False),
+    ('Pre_Op', 'Post_Op', True),
+    ('Week2', 'Unscheduled', True),
+    ('Week6', 'Month3', True),
+    # Timepoints outside after_vte_timepoints keep their values, as before the TIME_AXIS change
+    ('Pre_Op', 'Intra_Op', False),
+    ('Admission', 'PFD2', False),
+    ('POD1', 'Month6', False),
+    ('Intra_Op', 'POD1', False),
+    # Missing or unknown timepoints are never blanked
+    ('POD1', None, False),
+    (None, 'POD2', False),
+    ('POD1', 'Unknown', False),
+])
+def test_blanked_after_vte(vte_time, time, expected):
+    assert blanked([time], [vte_time]) == [expected]
+
+
+def test_only_lab_values_are_blanked():
+    processor = RedcapProcessor('https://redcap.example/api/', 'TOKEN', project=object())
+    processor.df = pd.DataFrame({'Time': ['POD3'], 'VTE_time': ['POD1'], 'Hemoglobin': [120.0],
+                                 **{col: 1.0 for col in TEG}})
+    processor._remove_data_after_vte()
+    assert processor.df[TEG].isna().all(axis=None)
+    assert processor.df.loc[0, 'Hemoglobin'] == 120.0
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from redcap_classes_V2 import PATIENT_ANNOTATION_COLUMNS, load_patient_annotations
+
+
+def test_shipped_table_loads_once():
+    annotations = load_patient_annotations()
+    assert list(annotations.columns) == PATIENT_ANNOTATION_COLUMNS
+    assert annotations.index.name == 'StudyID' and annotations.index.is_unique
+    assert annotations.loc['TH-244', 'Pre_op_med'] == 'Warfarin'
+
+
+def test_extra_columns_are_ignored(tmp_path):
+    path = tmp_path / 'annotations_v2.csv'
+    path.write_text('StudyID,VTE_time,UTI,Pre_op_med,note\nTH-001,POD1,,DOAC,x\n')
+    annotations = load_patient_annotations(str(path))
+    assert list(annotations.columns) == PATIENT_ANNOTATION_COLUMNS
+    assert pd.isna(annotations.loc['TH-001', 'UTI'])
+
+
+def test_missing_column_is_reported(tmp_path):
+    path = tmp_path / 'annotations_v2.csv'
+    path.write_text('StudyID,Pre_op_med,VTE_time\nTH-001,DOAC,POD1\n')
+    with pytest.raises(ValueError, match=r"\['UTI'\]"):
+        load_patient_annotations(str(path))
+
+
+def test_duplicate_study_ids_are_reported():
+    frame = pd.DataFrame({'StudyID': ['TH-001', 'TH-001'], 'Pre_op_med': ['ASA', 'DOAC'],
+                          'UTI': [None, None], 'VTE_time': [None, None]})
+    with pytest.raises(ValueError, match='TH-001'):
+        load_patient_annotations(frame)
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import redcap_classes_V2
+from redcap_classes_V2 import parse_redcap_datetimes
+
+
+def test_cache_eviction_keeps_strings_of_the_current_call(monkeypatch):
+    monkeypatch.setattr(redcap_classes_V2, '_PARSED_DATETIMES_MAX', 3)
+    monkeypatch.setattr(redcap_classes_V2, '_parsed_datetimes', {})
+
+    parse_redcap_datetimes(['2024-01-01', '2024-01-02'])
+    # '2024-01-01' is cached; the two new strings overflow the cache, which is cleared
+    parsed = parse_redcap_datetimes(['2024-01-01', '2024-01-03', '2024-01-04'])
+
+    assert list(parsed) == list(pd.to_datetime(['2024-01-01', '2024-01-03', '2024-01-04']))
+    assert len(redcap_classes_V2._parsed_datetimes) <= 3
+
+
+def test_matches_to_datetime():
+    values = pd.Series(['2024-01-01 08:30', '2024-01-01', 'not a date', None, '01/02/2024 10:00', '2024-01-01 08:30'])
+    expected = pd.to_datetime(values, errors='coerce')
+    pd.testing.assert_series_equal(parse_redcap_datetimes(values), expected)
+    assert parse_redcap_datetimes('2024-01-01') == pd.Timestamp('2024-01-01')
+
+
+def test_concurrent_parsing_with_a_small_cache(monkeypatch):
+    monkeypatch.setattr(redcap_classes_V2, '_PARSED_DATETIMES_MAX', 50)
+    monkeypatch.setattr(redcap_classes_V2, '_parsed_datetimes', {})
+    days = pd.date_range('2020-01-01', periods=400, freq='D')
+    chunks = [days[i::8].strftime('%Y-%m-%d %H:%M') for i in range(8)]
+
+    def parse(chunk):
+        return parse_redcap_datetimes(pd.Series(np.tile(chunk, 3)))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(parse, chunks * 5))
+
+    for chunk, result in zip(chunks * 5, results):
+        assert list(result) == list(pd.to_datetime(np.tile(chunk, 3)))
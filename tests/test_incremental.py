@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from redcap_classes_V2 import RedcapProcessor
+
+
+class FakeProject:
+    """export_records over in-memory rows; date_begin keeps records with a row modified since then."""
+
+    def_field = 'record_id'
+
+    def __init__(self, rows):
+        self.rows = rows  # (modified, row) pairs
+        self.calls = []
+
+    def export_records(self, records=None, fields=None, date_begin=None, **kwargs):
+        changed = {row['record_id'] for modified, row in self.rows if date_begin is None or modified >= date_begin}
+        self.calls.append({'date_begin': date_begin, 'records': sorted(changed)})
+        return [dict(row) for _, row in self.rows if row['record_id'] in changed]
+
+
+def row(record_id, event, age):
+    return {'record_id': record_id, 'redcap_event_name': event, 'bl_age': age}
+
+
+def sync(project, snapshot_dir):
+    processor = RedcapProcessor('https://redcap.example/api/', 'TOKEN', project=project, incremental=True,
+                                snapshot_dir=snapshot_dir)
+    processor._fetch_records()
+    return processor.df
+
+
+def test_incremental_sync_upserts_new_and_updated_records(tmp_path):
+    old = datetime(2000, 1, 1)
+    project = FakeProject([
+        (old, row('TH-001', 'Baseline', '70')),
+        (old, row('TH-001', 'POD1', None)),
+        (old, row('TH-002', 'Baseline', '65')),
+    ])
+    first = sync(project, tmp_path)
+    assert list(first['record_id']) == ['TH-001', 'TH-001', 'TH-002']
+
+    # TH-001 updated, TH-002 unchanged, TH-003 new
+    now = datetime.now()
+    project.rows = [
+        (now, row('TH-001', 'Baseline', '71')),
+        (old, row('TH-001', 'POD1', None)),
+        (old, row('TH-002', 'Baseline', '65')),
+        (now, row('TH-003', 'Baseline', '80')),
+    ]
+    merged = sync(project, tmp_path)
+
+    expected = pd.DataFrame([r for _, r in project.rows])
+    pd.testing.assert_frame_equal(merged, expected)
+
+    # Only the changed records were exported; TH-002 came from the snapshot
+    assert project.calls[-1]['records'] == ['TH-001', 'TH-003']
+
+
+def test_sync_time_is_stored_with_overlap(tmp_path):
+    project = FakeProject([(datetime(2000, 1, 1), row('TH-001', 'Baseline', '70'))])
+    sync(project, tmp_path)
+    sync(project, tmp_path)
+
+    # A server clock up to sync_overlap behind the client still sees records changed since the last sync
+    assert project.calls[-1]['date_begin'] <= datetime.now() - timedelta(hours=23)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from redcap_classes_V2 import RedcapProcessor
+
+TEG = ['R_time', 'K_time', 'Alpha_Angle', 'MA', 'LY30', 'ACT', 'ADP-agg', 'ADP-inh', 'ADP-ma',
+       'AA-agg', 'AA-inh', 'AA-ma', 'CFF-MA', 'ACTF-MA', 'CFF-A10', 'CFF-FLEV']
+
+
+def processed(hemoglobin, ma):
+    """Processor over one patient's three draws, after the last pipeline steps (coercion to records)."""
+    processor = RedcapProcessor('https://redcap.example/api/', 'TOKEN', project=object())
+    processor.df = pd.DataFrame({
+        'StudyID': 'TH-001', 'Study': 'TH', 'Time': ['Pre_Op', 'POD1', 'POD2'],
+        'redcap_event_name': ['pre_op', 'pod1', 'pod2'],
+        'Hemoglobin': [hemoglobin, '120', None], 'Creatinine': [None, '80', None], 'CAS': np.nan,
+        'blood_rbc': 0, 'blood_rbc_yn': 'No', 'VTE_type': None, 'VTE': 'No', 'VTE_time': None,
+        'Pre_op_med': None, **{col: None for col in TEG}, 'MA': [None, None, ma],
+    })
+    processor._coerce_lab_types()
+    processor._apply_categories()
+    processor._build_records()
+    return processor
+
+
+def test_unparsable_hemoglobin_keeps_the_lab_row():
+    # No Cr/CAS and blood_rbc == 0: only the recorded (if unparsable) Hgb keeps the draw
+    lab, _ = processed('<5', '60').get_all_labs()
+    pre_op = lab[lab['Time'] == 'Pre_Op']
+    assert len(pre_op) == 1
+    assert pre_op['Hemoglobin'].isna().all()
+
+
+def test_unparsable_teg_value_keeps_the_teg_row():
+    _, teg = processed('110', 'clotted').get_all_labs()
+    pod2 = teg[teg['Time'] == 'POD2']
+    assert len(pod2) == 1
+    assert pod2['MA'].isna().all()
+
+
+def test_missing_values_still_drop_the_lab_row():
+    lab, _ = processed(None, '60').get_all_labs()
+    assert 'Pre_Op' not in set(lab['Time'])
+
+
+def test_unparsable_values_do_not_change_the_output_rows():
+    clean, messy = processed('110', '60'), processed('<5', 'clotted')
+    assert clean.coercion_report.empty
+    assert set(messy.coercion_report['value']) == {'<5', 'clotted'}
+
+    for expected, table in zip(clean.get_all_labs(), messy.get_all_labs()):
+        assert len(table) == len(expected)
+        assert table[['StudyID', 'Time']].astype(str).values.tolist() == \
+            expected[['StudyID', 'Time']].astype(str).values.tolist()
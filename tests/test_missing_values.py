@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from redcap_classes_V2 import RedcapProcessor, mask_object_values
+
+RAW = pd.DataFrame({
+    'record_id': ['TH-001', 'TH-001', 'TH-002', 'TH-003'],
+    'bl_age': ['70', '  ', '-999', None],
+    'comp_dvt_yn': ['Not applicable', 'Yes', '', 'No'],
+    'reason_withdrawal': ['Participant Withdrawn', np.nan, 'NaN', '-2997'],
+    'bl_bmi': [25.0, np.nan, 31.5, 22.0],
+})
+
+
+def processor():
+    # Never contacts REDCap: the project is only used for exports
+    return RedcapProcessor('https://redcap.example/api/', 'TOKEN', project=object())
+
+
+def test_blank_strings_match_regex_replace():
+    expected = RAW.replace(r'^\s*$', np.nan, regex=True)
+    actual = mask_object_values(RAW, lambda v: isinstance(v, str) and not v.strip())
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_missing_codes_match_list_replace():
+    p = processor()
+    expected = RAW.replace(['None', '-999', '', 'NaN', 'Not applicable', '-2997', None], np.nan)
+    p.df = RAW
+    p._replace_missing_values()
+    pd.testing.assert_frame_equal(p.df, expected)
+
+
+def test_missing_codes_survive_until_step_10():
+    p = processor()
+    p.df = RAW
+    p._clean_data()
+
+    # Only blanks are cleared at step 02; the codes are still visible to steps 03-09
+    assert p.df['comp_dvt_yn'].tolist()[0] == 'Not applicable'
+    assert p.df['bl_age'].isna().tolist() == [False, True, False, True]
+    assert RAW['bl_age'].tolist()[1] == '  '  # the caller's frame is not modified
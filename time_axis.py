@@ -0,0 +1,14 @@
+"""Canonical time axis of the standardized timepoints (pandas only; shared by pipeline and analysis)."""
+import pandas as pd
+
+# The standardized timepoints in chronological order. RedcapProcessor stores Time and VTE_time
+# with this ordered dtype, so sorting, comparing and grouping use the category codes.
+TIME_AXIS = pd.CategoricalDtype([
+    'Admission', 'PFD1', 'PFD2', 'PFD3', 'PFD4', 'Pre_Op', 'Intra_Op', 'Post_Op',
+    'POD1', 'POD2', 'POD3', 'POD4', 'POD5', 'POD6', 'POD7', 'POD8', 'POD9', 'POD10',
+    'Week2', 'Week4', 'Week6', 'Week10', 'Month3', 'Month6', 'Unscheduled',
+], ordered=True)
+
+# Axis tick labels of the timepoints (timepoints not listed keep their name)
+TIME_LABELS = {tp: tp for tp in TIME_AXIS.categories}
+TIME_LABELS.update({'Pre_Op': 'PreOp', 'Post_Op': 'PO1H', 'POD5': 'PD5', 'POD7': 'PD7'})